@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+import sys, os, json, time, random, gc, tracemalloc, platform, shutil, stat, tempfile
+import http.server
+import subprocess as sp
+import pydistro
+from pydistro import Packages, Distros
+from utils import Utils
+
+## ---------------------------------------------------------------------------------------------- ##
+
+IMPORT_BUDGET = 0.05
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'requests', 'urllib3', 'tabulate', 'packaging']
+IMPORT_PROBE = f"""
+import sys, time, json
+t = time.perf_counter()
+import pydistro
+elapsed = time.perf_counter() - t
+print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))
+"""
+
+# suite defaults: package counts x distro counts, PyPI latency in seconds
+SUITE_PACKAGES = [100, 1000, 10000]
+SUITE_DISTROS = [1, 10, 100]
+SUITE_LATENCY = 0.01
+SUITE_FORMAT = 'pydistro-bench'
+# share of packages installed in another version in each distro, share of packages only some distros have
+SUITE_CHANGED = 0.1
+SUITE_EXTRA = 0.02
+EXPORTERS = {'to_xl': 'pk.xlsx', 'to_csv': 'pk.csv', 'to_html': 'pk.html', 'to_json': 'pk.json',
+             'to_pickle': 'pk.gz', 'to_string': None, 'to_stringx': None}
+
+# stand-in interpreter of a synthetic distro: answers 'pip list' from a file, runs anything else
+# in the real interpreter, with only the synthetic site-packages (and the stdlib) on the path
+FAKE_PYTHON = """#!/bin/sh
+if [ "$1" = "-m" ] && [ "$2" = "pip" ] && [ "$3" = "list" ]; then exec cat "{piplist}"; fi
+PYTHONPATH="{paths}" exec "{python}" -S "$@"
+"""
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def make_cache(size):
+    return {f'pkg{i}': {'name': f'pkg{i}', 'author': 'author', 'summary': 'summary',
+                        'homepage': f'https://example.com/pkg{i}', 'latest': '2.0.0'} for i in range(size)}
+
+def make_packages(size, cache, seed=0):
+    rnd = random.Random(seed)
+    names = rnd.sample(list(cache.keys()), size)
+    return Packages([(name, f'{rnd.randrange(3)}.{rnd.randrange(10)}.{rnd.randrange(10)}') for name in names], cache)
+
+def timeit(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def parse_options(args, defaults):
+    # key=value command line options; list defaults take comma-separated values
+    options = dict(defaults)
+    for arg in args:
+        key, _, value = arg.partition('=')
+        if key not in defaults:
+            raise SystemExit(f'Unknown option "{key}"! Options: {", ".join(defaults)}')
+        default = defaults[key]
+        if isinstance(default, list):
+            options[key] = [type(default[0])(v) for v in value.split(',') if v]
+        else:
+            options[key] = type(default)(value) if default is not None else value
+    return options
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class StubPyPIHandler(http.server.BaseHTTPRequestHandler):
+
+    latency = 0.0
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes: without this, keep-alive replies wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'pypi' and parts[2] == 'json':
+            name, content_type = parts[1], 'application/json'
+            body = json.dumps({'info': {'name': name, 'author': 'Bench Author', 'summary': f'Synthetic package {name}',
+                                        'home_page': f'https://example.com/{name}', 'version': '9.9.9'}}).encode('utf-8')
+        elif len(parts) == 2 and parts[0] == 'simple':
+            name, content_type = parts[1], 'application/vnd.pypi.simple.v1+json'
+            # PEP 691 pages carry the normalized project name
+            body = json.dumps({'meta': {'api-version': '1.1'}, 'name': Utils.normalize_name(name), 'versions': ['1.0', '9.9.9'],
+                               'files': [{'filename': f'{name}-{v}.tar.gz'} for v in ('1.0', '9.9.9')]}).encode('utf-8')
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', f'"{name}-9.9.9"')
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except OSError:
+            pass   # the client gave up (timeout)
+
+def make_stub_server(latency=0.0, port=0):
+    handler = type('Handler', (StubPyPIHandler,), {'latency': latency})
+    server_class = type('Server', (http.server.ThreadingHTTPServer,), {'request_queue_size': 1024, 'daemon_threads': True})
+    return server_class(('127.0.0.1', port), handler)
+
+class StubPyPI:
+
+    # local PyPI JSON API and simple index answering any package name after the given latency (in seconds);
+    # it runs in a separate process ('python bench.py stub'), so that serving doesn't compete with the client for the GIL
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.url = None
+        self._proc = None
+
+    def __enter__(self):
+        self._proc = sp.Popen([sys.executable, os.path.realpath(__file__), 'stub', f'latency={self.latency}'],
+                              stdout=sp.PIPE, encoding='utf-8')
+        self.url = self._proc.stdout.readline().strip()
+        if not self.url:
+            raise Exception('The stub PyPI server failed to start!')
+        return self
+
+    def __exit__(self, *args):
+        self._proc.terminate()
+        self._proc.wait()
+        self._proc.stdout.close()
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def make_site(path, dists):
+    # site-packages directory with a minimal *.dist-info entry per (name, version)
+    os.makedirs(path, exist_ok=True)
+    for name, version in dists:
+        infodir = os.path.join(path, f'{name}-{version}.dist-info')
+        os.makedirs(infodir, exist_ok=True)
+        with open(os.path.join(infodir, 'METADATA'), 'w', encoding='utf-8') as mdfile:
+            mdfile.write(f'Metadata-Version: 2.1{os.linesep}Name: {name}{os.linesep}Version: {version}{os.linesep}{os.linesep}')
+
+def make_envs(root, packages, distros, seed=0):
+    # synthetic distros sharing one base site-packages: each distro has its own overlay directory
+    # (first on the path) with some packages in other versions and some packages only it has;
+    # returns {fake interpreter path: alias}
+    rnd = random.Random(seed)
+    base = [(f'pkg{i:05d}', f'{rnd.randrange(1, 4)}.{rnd.randrange(10)}.{rnd.randrange(10)}') for i in range(packages)]
+    make_site(os.path.join(root, 'base'), base)
+    envs = {}
+    for d in range(distros):
+        changed = [(name, f'{rnd.randrange(4, 6)}.{rnd.randrange(10)}.0') for name, _ in rnd.sample(base, int(packages * SUITE_CHANGED))]
+        extra = [(f'extra{rnd.randrange(packages):05d}', '1.0.0') for _ in range(max(1, int(packages * SUITE_EXTRA)))]
+        envdir = os.path.join(root, f'env{d:03d}')
+        overlay = os.path.join(envdir, 'site-packages')
+        make_site(overlay, changed + extra)
+        listed = dict(base)
+        listed.update(changed + extra)
+        piplist = os.path.join(envdir, 'pip-list.txt')
+        with open(piplist, 'w', encoding='utf-8') as plfile:
+            plfile.write(''.join(f'{name}=={version}{os.linesep}' for name, version in sorted(listed.items())))
+        pyexe = os.path.join(envdir, 'bin', 'python')
+        os.makedirs(os.path.dirname(pyexe), exist_ok=True)
+        with open(pyexe, 'w', encoding='utf-8') as pyfile:
+            pyfile.write(FAKE_PYTHON.format(piplist=piplist, paths=os.pathsep.join([overlay, os.path.join(root, 'base')]), python=sys.executable))
+        os.chmod(pyexe, os.stat(pyexe).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        envs[pyexe] = f'env{d:03d}'
+    return envs
+
+def timed(func):
+    t = time.perf_counter()
+    res = func()
+    return res, time.perf_counter() - t
+
+def bench_distros(envs, url, workdir):
+    # timings of one synthetic fleet: cold construction (empty cache, all packages from the stub PyPI),
+    # warm construction from the saved cache, the 'pip list' fallback, the outdated scan (latest versions from
+    # the simple index), set operations, dataframe and exporters
+    results = {}
+    dbdir = os.path.join(workdir, 'db')
+    os.makedirs(dbdir, exist_ok=True)
+    ds, results['construct_cold'] = timed(lambda: Distros(envs, dbdir, save_on_exit=False, on_error=None, pypi_url=url))
+    if len(ds.distros) != len(envs):
+        raise Exception(f'Only {len(ds.distros)} of {len(envs)} synthetic distros could be read!')
+    ds.save_db()
+    del ds
+    ds, results['construct_warm'] = timed(lambda: Distros(envs, dbdir, save_on_exit=False, on_error=None, pypi_url=url))
+    fast_list, pydistro.FAST_LIST = pydistro.FAST_LIST, False
+    try:
+        _, results['construct_piplist'] = timed(lambda: Distros(envs, dbdir, save_on_exit=False, on_error=None, pypi_url=url))
+    finally:
+        pydistro.FAST_LIST = fast_list
+    _, results['outdated_scan'] = timed(lambda: sum(1 for _ in ds.iter_outdated()))
+
+    d1 = ds.distros[0]
+    d2 = ds.distros[1] if len(ds.distros) > 1 else ds.distros[0]
+    for op, name in (('+', 'fullunion'), ('-', 'difference'), ('&', 'intersection'), ('|', 'union'), ('^', 'symdiff')):
+        results[f'setops_{name}'] = timeit(lambda: d1._get_merged(d2, op), 3)
+
+    df, results['dataframe'] = timed(ds.asdataframe)
+    for exporter, filename in EXPORTERS.items():
+        args = {'df': df}
+        if filename:
+            args['filepath'] = os.path.join(workdir, filename)
+        _, results[f'export_{exporter}'] = timed(lambda: getattr(ds, exporter)(**args))
+    return results
+
+def bench_suite(packages=SUITE_PACKAGES, distros=SUITE_DISTROS, latency=SUITE_LATENCY, on_result=None):
+    # {'<benchmark>[<packages>x<distros>]': seconds} over the whole grid; trees are generated
+    # once per package count (for the largest distro count) and removed afterwards
+    if os.name != 'posix':
+        raise SystemExit('The benchmark suite needs a POSIX shell for its synthetic interpreters!')
+    results = {}
+    # import the lazily loaded modules up front, so that the first timings don't include them
+    for module in HEAVY_MODULES:
+        __import__(module)
+    root = tempfile.mkdtemp(prefix='pydistro-bench-')
+    try:
+        with StubPyPI(latency) as pypi:
+            for npk in packages:
+                treedir = os.path.join(root, f'trees{npk}')
+                envs = list(make_envs(treedir, npk, max(distros)).items())
+                for nd in distros:
+                    workdir = os.path.join(root, f'run{npk}x{nd}')
+                    os.makedirs(workdir)
+                    for name, elapsed in bench_distros(dict(envs[:nd]), pypi.url, workdir).items():
+                        key = f'{name}[{npk}x{nd}]'
+                        results[key] = elapsed
+                        if on_result: on_result(key, elapsed)
+                    shutil.rmtree(workdir, ignore_errors=True)
+                shutil.rmtree(treedir, ignore_errors=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+def suite_meta(options):
+    try:
+        commit = sp.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.realpath(__file__)),
+                                 stderr=sp.DEVNULL, encoding='utf-8').strip()
+    except (OSError, sp.CalledProcessError):
+        commit = None
+    return {'format': SUITE_FORMAT, 'version': 1, 'created': time.time(), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'options': options}
+
+def compare_results(old, new):
+    # (benchmark, old seconds, new seconds, new / old) for the benchmarks present in both result files
+    old, new = old['results'], new['results']
+    return [(key, old[key], new[key], new[key] / old[key] if old[key] else float('inf')) for key in old if key in new]
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def bench_setops(size=10000):
+    cache = make_cache(size * 3 // 2)
+    pks1 = make_packages(size, cache, 1)
+    pks2 = make_packages(size, cache, 2)
+    return {op: timeit(lambda: pks1._get_merged(pks2, op)) for op in ('+', '-', '&', '|', '^')}
+
+def bench_memory(size=10000):
+    # bytes held per package by a Packages list built from an in-memory cache; a first list warms up
+    # the one-off structures (parsed versions, interned names), as in any run with more than one distro
+    cache = make_cache(size)
+    rnd = random.Random(0)
+    pknames = [(name, f'{rnd.randrange(3)}.{rnd.randrange(10)}.{rnd.randrange(10)}') for name in cache]
+    warm = Packages(pknames, cache)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    pks = Packages(pknames, cache)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return total / len(pks.packages)
+
+def bench_import(repeat=5):
+    # fresh interpreters importing pydistro (bytecode caching allowed, the first run only warms it up)
+    env = {k: v for k, v in os.environ.items() if k != 'PYTHONDONTWRITEBYTECODE'}
+    cwd = os.path.dirname(os.path.realpath(__file__))
+    results = [json.loads(sp.check_output([sys.executable, '-c', IMPORT_PROBE], cwd=cwd, env=env, encoding='utf-8'))
+               for _ in range(repeat + 1)][1:]
+    return min(r[0] for r in results), sorted(set(m for r in results for m in r[1]))
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def main():
+    what = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    ok = True
+
+    if what in ('all', 'import'):
+        elapsed, heavy = bench_import()
+        ok = elapsed <= IMPORT_BUDGET and not heavy
+        print(f'IMPORT pydistro: {elapsed * 1000:.2f} ms (budget {IMPORT_BUDGET * 1000:.0f} ms)'
+              f'{", loads " + ", ".join(heavy) if heavy else ""} -- {"OK" if ok else "OVER BUDGET"}')
+
+    if what in ('all', 'setops'):
+        size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        print(f'SET OPERATIONS ({size} x {size} PACKAGES):')
+        for op, elapsed in bench_setops(size).items():
+            print(f'  {op}  {elapsed * 1000:8.2f} ms')
+
+    if what in ('all', 'memory'):
+        size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+        print(f'MEMORY ({size} PACKAGES): {bench_memory(size):.0f} bytes per package')
+
+    if what == 'suite':
+        options = parse_options(sys.argv[2:], {'packages': SUITE_PACKAGES, 'distros': SUITE_DISTROS,
+                                               'latency': SUITE_LATENCY, 'out': 'bench.json'})
+        print(f'SUITE ({"/".join(map(str, options["packages"]))} PACKAGES x {"/".join(map(str, options["distros"]))} DISTROS, '
+              f'PYPI LATENCY {options["latency"] * 1000:.0f} ms):')
+        results = bench_suite(options['packages'], options['distros'], options['latency'],
+                              lambda key, elapsed: print(f'  {key:<40} {elapsed * 1000:12.2f} ms', flush=True))
+        with open(options['out'], 'w', encoding='utf-8') as resfile:
+            json.dump(dict(suite_meta(options), results=results), resfile, indent=2)
+        print(f'SAVED TO "{options["out"]}"')
+
+    if what == 'stub':
+        options = parse_options(sys.argv[2:], {'latency': 0.0, 'port': 0})
+        server = make_stub_server(options['latency'], options['port'])
+        print(f'http://127.0.0.1:{server.server_port}', flush=True)
+        server.serve_forever()
+
+    if what == 'compare':
+        if len(sys.argv) < 4:
+            raise SystemExit('Usage: python bench.py compare OLD.json NEW.json')
+        with open(sys.argv[2], 'r', encoding='utf-8') as oldfile, open(sys.argv[3], 'r', encoding='utf-8') as newfile:
+            rows = compare_results(json.load(oldfile), json.load(newfile))
+        for key, old, new, ratio in rows:
+            print(f'  {key:<40} {old * 1000:12.2f} ms {new * 1000:12.2f} ms  x{ratio:.2f}')
+
+    sys.exit(0 if ok else 1)
+
+## ---------------------------------------------------------------------------------------------- ##
+if __name__ == '__main__':
+    main()
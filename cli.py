@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import sys, json, csv, argparse
+from pydistro import Distros, Package
+
+## ---------------------------------------------------------------------------------------------- ##
+
+# python -m pydistro COMMAND [options]: rows go to stdout (NDJSON or CSV) as soon as they are known,
+# messages and errors go to stderr
+COMMANDS = {
+    'list': 'installed packages of every distro',
+    'outdated': 'installed packages older than their latest version on PyPI (refreshed from the simple index)',
+    'compare': 'version of every package in each distro',
+    'diff': 'packages missing from some distros or installed in different versions',
+    'query': 'distros having packages in the given version ranges',
+    'sync': 'install packages into the distros',
+}
+LIST_FIELDS = ['distro', 'name', 'version'] + [p for p in Package.prop_names if p != 'name']
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class RowWriter:
+
+    # NDJSON (one object per line) or CSV (header taken from the fields) rows, flushed one by one
+    def __init__(self, fmt='ndjson', stream=None):
+        self.fmt = fmt
+        self.stream = stream or sys.stdout
+        self.count = 0
+        self._csv = None
+
+    def fields(self, fields):
+        if self.fmt == 'csv' and self._csv is None:
+            self._csv = csv.DictWriter(self.stream, fieldnames=fields, restval='', extrasaction='ignore', lineterminator='\n')
+            self._csv.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.fields(list(row.keys()))
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.stream.flush()
+        self.count += 1
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def parse_interpreter(value):
+    # 'path' or 'path=alias'; an empty path is the current interpreter
+    path, _, alias = value.partition('=')
+    return (path or None, alias or None)
+
+def load_config(filepath):
+    # JSON: {"interpreters": {path: alias} or [path or "path=alias", ...], "snapshots": [...], "dbdir": ...,
+    #        "db_backend": ..., "pypi_url": ..., "force_update": ...}
+    with open(filepath, 'r', encoding='utf-8') as cfgfile:
+        config = json.load(cfgfile)
+    interpreters = config.get('interpreters', [])
+    if isinstance(interpreters, dict):
+        config['interpreters'] = [(path or None, alias or None) for path, alias in interpreters.items()]
+    else:
+        config['interpreters'] = [parse_interpreter(value or '') for value in interpreters]
+    return config
+
+def parse_packages(specs):
+    # 'name' or 'name==version' -> [(name, version or None)]
+    packages = []
+    for spec in specs:
+        name, _, version = spec.partition('==')
+        packages.append((name.strip(), version.strip() or None))
+    return packages
+
+def parse_force_update(value):
+    # 'yes' / 'no' or a TTL in hours
+    if value.lower() in ('1', 'yes', 'true', 'all'): return True
+    if value.lower() in ('0', 'no', 'false', 'none'): return False
+    return float(value)
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='python -m pydistro', description='Compare, list and update python distros.')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-i', '--interpreter', action='append', default=[], metavar='PATH[=ALIAS]',
+                        help='python executable to read (repeatable; default = the current one)')
+    common.add_argument('-c', '--config', metavar='FILE', help='JSON file with the interpreters and other options')
+    common.add_argument('-s', '--snapshot', action='append', default=[], metavar='FILE', help='distro snapshot to read (repeatable)')
+    common.add_argument('-f', '--format', choices=('ndjson', 'csv'), default='ndjson', help='output format (default = ndjson)')
+    common.add_argument('--dbdir', help='package database directory')
+    common.add_argument('--db-backend', choices=('json', 'sqlite'), help='package database backend')
+    common.add_argument('--pypi-url', help='package index URL (JSON API or simple index)')
+    common.add_argument('--force-update', type=parse_force_update, metavar='yes|no|HOURS', help='refresh the cached package info')
+    common.add_argument('--no-save', action='store_true', help="don't save the package database")
+    common.add_argument('--check', action='store_true', help='exit with status 1 if any rows were output')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+    for command, description in COMMANDS.items():
+        sub = commands.add_parser(command, parents=[common], help=description, description=description)
+        if command == 'outdated':
+            sub.add_argument('--cached', action='store_true', help="use the cached latest versions, don't refresh them")
+            sub.add_argument('--max-age', type=float, metavar='HOURS', help="don't refresh the latest versions checked within HOURS")
+            sub.add_argument('--index-url', help='simple index to read the latest versions from (default = the one of --pypi-url)')
+        if command == 'query':
+            sub.add_argument('queries', nargs='+', metavar='REQUIREMENT', help="package and optional version specifier, e.g. 'urllib3<2'")
+        if command == 'sync':
+            sub.add_argument('packages', nargs='+', metavar='NAME[==VERSION]', help='packages to install')
+            sub.add_argument('--force-version', action='store_true', help='reinstall the exact versions given')
+            sub.add_argument('--no-upgrade', action='store_true', help="don't upgrade installed packages")
+            sub.add_argument('--chunk-size', type=int, default=None, help='packages per pip run (default = all at once)')
+    return parser
+
+def make_distros(args, on_distro=None):
+    config = load_config(args.config) if args.config else {}
+    interpreters = [parse_interpreter(value) for value in args.interpreter] or config.get('interpreters', [])
+    snapshots = args.snapshot or config.get('snapshots', None)
+    if not interpreters and not snapshots:
+        interpreters = [(None, None)]
+    options = {'dbdir': args.dbdir or config.get('dbdir', None),
+               'db_backend': args.db_backend or config.get('db_backend', 'json'),
+               'pypi_url': args.pypi_url or config.get('pypi_url', None),
+               'force_update': args.force_update if args.force_update is not None else config.get('force_update', False)}
+    on_error = lambda err: print(err, file=sys.stderr)
+    # snapshots are loaded before the interpreters are read, so they are reported here
+    distros = Distros(interpreters or None, save_on_exit=not args.no_save, on_error=on_error, snapshots=snapshots,
+                      on_distro=on_distro, **options)
+    if snapshots and on_distro:
+        for d in distros.distros:
+            if d.host: on_distro(d)
+    return distros
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def package_row(distro, pk):
+    row = {'distro': distro.alias, 'name': pk.name, 'version': pk.version}
+    row.update((p, getattr(pk, p, '')) for p in Package.prop_names if p != 'name')
+    return row
+
+def run(args, out):
+    if args.command == 'list':
+        out.fields(LIST_FIELDS)
+        def on_distro(distro):
+            for pk in distro.packages:
+                out.write(package_row(distro, pk))
+        make_distros(args, on_distro)
+
+    elif args.command == 'outdated':
+        # the latest versions are refreshed concurrently and the rows written as the replies arrive
+        distros = make_distros(args)
+        out.fields(LIST_FIELDS)
+        for distro, pk in distros.iter_outdated(not args.cached, args.index_url, args.max_age):
+            out.write(package_row(distro, pk))
+
+    elif args.command in ('compare', 'diff'):
+        distros = make_distros(args)
+        out.fields(Package.prop_names + [d.alias for d in distros.distros])
+        for row in distros.iterrows(differs_only=args.command == 'diff'):
+            out.write(row)
+
+    elif args.command == 'query':
+        distros = make_distros(args)
+        out.fields(['query', 'distro', 'version'])
+        for query in args.queries:
+            for alias, version in distros.query(query).items():
+                out.write({'query': query, 'distro': alias, 'version': version})
+
+    elif args.command == 'sync':
+        packages = parse_packages(args.packages)
+        distros = make_distros(args)
+        out.fields(['distro', 'package', 'output'])
+        distros.sync(packages, upgrade=not args.no_upgrade, force_version=args.force_version, chunk_size=args.chunk_size,
+                     on_install=lambda distro, pk, res: out.write({'distro': distro.alias, 'package': pk.name, 'output': res}))
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    out = RowWriter(args.format)
+    try:
+        run(args, out)
+    except BrokenPipeError:
+        # the reading end of the pipe is gone (e.g. '| head'): stop quietly
+        sys.stdout = None
+        return 0
+    except Exception as err:
+        print(f'Error: {str(err)}', file=sys.stderr)
+        return 2
+    return 1 if args.check and out.count else 0
+
+## ---------------------------------------------------------------------------------------------- ##
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from packaging.requirements import Requirement, InvalidRequirement
+from packaging.utils import canonicalize_name
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class DependencyGraph:
+
+    def __init__(self, dists, environment=None):
+        # dists: iterable of (name, version, [Requires-Dist strings]);
+        # environment: PEP 508 marker values of the target interpreter (None = current one)
+        self.environment = dict(environment or {})
+        self.environment['extra'] = ''
+        self.names = {}
+        self.versions = {}
+        self._requires = {}
+        self._required_by = {}
+        dists = list(dists)
+        for name, version, _ in dists:
+            key = canonicalize_name(name)
+            self.names[key] = name
+            self.versions[key] = version
+            self._requires[key] = []
+            self._required_by[key] = []
+        for name, _, reqs in dists:
+            key = canonicalize_name(name)
+            for req in self._active_requirements(reqs):
+                dep = canonicalize_name(req.name)
+                if dep in self._requires[key]: continue
+                self._requires[key].append(dep)
+                self._required_by.setdefault(dep, []).append(key)
+
+    def _active_requirements(self, reqs):
+        # skip extras-only and marker-excluded requirements, as 'pip show' does
+        for req in reqs:
+            try:
+                req = Requirement(req)
+            except InvalidRequirement:
+                continue
+            if req.marker is None or req.marker.evaluate(self.environment):
+                yield req
+
+    def _name(self, key):
+        return self.names.get(key, key)
+
+    def _closure(self, pkname, edges):
+        seen = {}
+        stack = [canonicalize_name(pkname)]
+        while stack:
+            for dep in edges.get(stack.pop(), ()):
+                if dep not in seen:
+                    seen[dep] = True
+                    stack.append(dep)
+        return [self._name(key) for key in seen]
+
+    def requires(self, pkname):
+        key = canonicalize_name(pkname)
+        if key not in self._requires: return None
+        return [self._name(dep) for dep in self._requires[key]]
+
+    def required_by(self, pkname):
+        key = canonicalize_name(pkname)
+        if key not in self._required_by: return None
+        return [self._name(dep) for dep in self._required_by[key]]
+
+    def requires_all(self, pkname):
+        return self._closure(pkname, self._requires)
+
+    def required_by_all(self, pkname):
+        return self._closure(pkname, self._required_by)
+
+    def missing(self):
+        # requirements that are not installed: {required package: [packages requiring it]}
+        return {self._name(key): [self._name(pk) for pk in pks] for key, pks in self._required_by.items() if key not in self.versions}
+
+    def roots(self):
+        # installed packages that nothing else depends on
+        return [self._name(key) for key in self.versions if not self._required_by.get(key, None)]
+
+    def tree(self, pkname, depth=-1):
+        # nested {name: {dependency: {...}}} dict; cycles are cut at the first repeat
+        def walk(key, level, path):
+            if key in path or level == 0: return {}
+            return {self._name(dep): walk(dep, level - 1, path | {key}) for dep in self._requires.get(key, ())}
+        key = canonicalize_name(pkname)
+        return {self._name(key): walk(key, depth, set())}
+
+    def __contains__(self, pkname):
+        return canonicalize_name(pkname) in self.versions
+
+    def __len__(self):
+        return len(self.versions)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import os, csv, mmap, base64, hashlib
+import concurrent.futures
+import instrument
+
+## ---------------------------------------------------------------------------------------------- ##
+
+FILENAME = 'pyhashes.json'
+# files from this size on are hashed through a memory map instead of read() calls
+MMAP_THRESHOLD = 1 << 20
+# files are hashed in tasks of about this many bytes (or BATCH_FILES files), so that a pool task outweighs its overhead
+BATCH_BYTES = 32 << 20
+BATCH_FILES = 256
+STATUSES = ('identical', 'modified', 'missing')
+
+# content check of installed distributions against their RECORD files (wheel installs, PEP 376/627):
+# every file listed with a hash is hashed again and compared; digests are cached by {path: [size, mtime, algorithm, digest]}
+# (any dict-like store, e.g. a pkcache.JsonCache), so that files unchanged since the last check aren't read again
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def read_record(infodir):
+    # [(relative path, algorithm, urlsafe base64 digest)] of the hashed files listed in RECORD, None without a RECORD
+    filepath = os.path.join(infodir, 'RECORD')
+    if not os.path.isfile(filepath): return None
+    files = []
+    with open(filepath, 'r', encoding='utf-8', errors='replace', newline='') as rcfile:
+        for row in csv.reader(rcfile):
+            if len(row) < 2 or '=' not in row[1]: continue
+            algo, _, digest = row[1].partition('=')
+            files.append((row[0], algo, digest))
+    return files
+
+def hash_file(filepath, algo='sha256'):
+    # digest as written in RECORD (urlsafe base64 without padding)
+    hasher = hashlib.new(algo)
+    with open(filepath, 'rb') as file_:
+        size = os.fstat(file_.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+        else:
+            hasher.update(file_.read())
+    return base64.urlsafe_b64encode(hasher.digest()).rstrip(b'=').decode('ascii')
+
+def hash_batch(batch):
+    # [(filepath, digest or None if unreadable)] for [(filepath, algorithm)]; runs in the pool workers
+    hashed = []
+    for filepath, algo in batch:
+        try:
+            hashed.append((filepath, hash_file(filepath, algo)))
+        except (OSError, ValueError):
+            hashed.append((filepath, None))
+    return hashed
+
+def hash_files(files, cache=None, executor_class=concurrent.futures.ProcessPoolExecutor, max_workers=None):
+    # {filepath: digest or None (missing)} for {filepath: algorithm}; digests cached under the same size,
+    # mtime and algorithm are reused, the others are computed in batches on the executor (inline if there is
+    # a single batch or a single CPU)
+    digests = {}
+    batches, batch, batch_size = [], [], 0
+    stats = {}
+    for filepath, algo in files.items():
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            digests[filepath] = None
+            continue
+        stats[filepath] = (st.st_size, st.st_mtime_ns)
+        cached = cache.get(filepath, None) if cache is not None else None
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns and cached[2] == algo:
+            digests[filepath] = cached[3]
+            continue
+        batch.append((filepath, algo))
+        batch_size += st.st_size
+        if batch_size >= BATCH_BYTES or len(batch) >= BATCH_FILES:
+            batches.append(batch)
+            batch, batch_size = [], 0
+    if batch:
+        batches.append(batch)
+    todo = sum(len(b) for b in batches)
+    instrument.count('hash_cache_hits', len(stats) - todo)
+    instrument.count('files_hashed', todo)
+
+    with instrument.phase('hash', label=f'hash ({todo} files)', files=todo):
+        # hashing is CPU-bound: no more workers than CPUs
+        workers = min(len(batches), max_workers or os.cpu_count() or 1, os.cpu_count() or 1)
+        if workers > 1:
+            with executor_class(max_workers=workers) as executor:
+                results = list(executor.map(hash_batch, batches))
+        else:
+            results = [hash_batch(b) for b in batches]
+    for hashed in results:
+        for filepath, digest in hashed:
+            digests[filepath] = digest
+            if cache is not None and digest is not None:
+                cache[filepath] = [*stats[filepath], files[filepath], digest]
+    return digests
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def locate_dists(fingerprint):
+    # {lowercase name: metadata directory path} from a fingerprint (see Utils.fingerprint_env), first one on the path wins
+    dists = {}
+    for path, (_, entries) in fingerprint.items():
+        for entry, (_, name, _) in entries.items():
+            dists.setdefault(name.lower(), os.path.join(path, entry))
+    return dists
+
+def record_files(infodir):
+    # {absolute path: (relative path, algorithm, expected digest)} of a distribution, None without a RECORD
+    record = read_record(infodir)
+    if record is None: return None
+    root = os.path.dirname(infodir)
+    return {os.path.normpath(os.path.join(root, relpath)): (relpath, algo, digest) for relpath, algo, digest in record}
+
+def check_dist(files, digests):
+    # {'status', 'identical', 'modified', 'missing', 'content'} for the record_files() of a distribution: status is the
+    # worst finding ('modified' before 'missing'); content is a digest of the installed files, equal for equal installs
+    counts = dict.fromkeys(STATUSES, 0)
+    content = hashlib.sha256()
+    for filepath, (relpath, _, expected) in sorted(files.items(), key=lambda kv: kv[1][0]):
+        actual = digests.get(filepath, None)
+        counts['missing' if actual is None else 'identical' if actual == expected else 'modified'] += 1
+        content.update(f'{relpath}={actual}\n'.encode('utf-8'))
+    status = 'modified' if counts['modified'] else 'missing' if counts['missing'] else 'identical'
+    return dict(counts, status=status, content=content.hexdigest())
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import os, json, stat, threading
+
+## ---------------------------------------------------------------------------------------------- ##
+
+FILENAME = 'pyenvs.json'
+
+# on-disk cache of what enumerate_env() found for each interpreter: {pyexe: record}, where
+#   record = {'key': key, 'env': probe result, 'fingerprint': fingerprint or None, 'packages': [[names], [versions]]}
+#   key = [[executable mtime, inode, size], [[import path, mtime, inode], ...], fast_list]
+# the key of a cached interpreter is rebuilt with a few os.stat() and directory scans and without running it;
+# any change to the executable or to one of its import path directories holding distributions (such as installing,
+# removing or upgrading a package in site-packages) invalidates the record. Directories without distributions
+# (the stdlib, the script directory, which may be the database directory too) are keyed with a null mtime and inode,
+# so that writing other files there doesn't count as a change, while a first distribution installed there does
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class EnvCache:
+
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+        self._data = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self._dirty = False
+            try:
+                with open(self.filepath, 'r', encoding='utf-8') as jsfile:
+                    data = json.load(jsfile)
+                self._data = data if isinstance(data, dict) else {}
+            except (OSError, ValueError):
+                self._data = {}
+        return self
+
+    def save(self):
+        with self._lock:
+            if not self._dirty: return False
+            tmpfile = f'{self.filepath}.{os.getpid()}.tmp'
+            with open(tmpfile, 'w', encoding='utf-8') as jsfile:
+                json.dump(self._data, jsfile, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmpfile, self.filepath)
+            self._dirty = False
+            return True
+
+    @staticmethod
+    def make_key(pyexe, env, fast_list):
+        try:
+            st = os.stat(pyexe)
+        except OSError:
+            return None
+        dirs = []
+        for path in env.get('path', []):
+            if not path: continue
+            try:
+                dst = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISDIR(dst.st_mode):
+                dirs.append([path, dst.st_mtime_ns, dst.st_ino] if EnvCache.has_dists(path) else [path, None, None])
+        return [[st.st_mtime_ns, st.st_ino, st.st_size], dirs, bool(fast_list)]
+
+    @staticmethod
+    def has_dists(path):
+        # True if the directory holds *.dist-info or *.egg-info entries (stops at the first one)
+        try:
+            with os.scandir(path) as entries:
+                return any(entry.name.endswith(('.dist-info', '.egg-info')) for entry in entries)
+        except OSError:
+            return False
+
+    def get(self, pyexe, fast_list):
+        # (env, fingerprint, [(name, version)]) as enumerate_env() returns it, or None if the interpreter is
+        # not cached or has changed since
+        record = self._data.get(pyexe, None)
+        if not record or EnvCache.make_key(pyexe, record['env'], fast_list) != record['key']:
+            return None
+        return record['env'], record['fingerprint'], list(zip(*record['packages']))
+
+    def put(self, pyexe, listing, fast_list):
+        env, fingerprint, packages = listing
+        # without the import paths, package changes couldn't be detected
+        if not env or not env.get('path', None): return False
+        key = EnvCache.make_key(pyexe, env, fast_list)
+        if key is None: return False
+        # a directory changed after it was scanned: the listing may be stale already
+        if fingerprint and any(mtime is not None and path in fingerprint and fingerprint[path][0] != mtime for path, mtime, _ in key[1]):
+            return False
+        with self._lock:
+            self._data[pyexe] = {'key': key, 'env': env, 'fingerprint': fingerprint,
+                                 'packages': [[name for name, _ in packages], [version for _, version in packages]]}
+            self._dirty = True
+        return True
+
+    def has_updated(self):
+        return self._dirty
+
+    def __len__(self):
+        return len(self._data)
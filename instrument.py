@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import os, json, time, threading, contextlib
+
+## ---------------------------------------------------------------------------------------------- ##
+
+# phases timed by pydistro (they may nest, e.g. 'fetch' runs within the construction of a distro):
+#   'enumerate' - probing interpreters and listing their packages (scans or pip subprocesses)
+#   'cache'     - package database load, lookups and save
+#   'fetch'     - PyPI requests
+#   'construct' - building Package objects
+#   'dataframe' - building dataframes and version matrices
+#   'export'    - writing dataframes to files, strings or the clipboard
+#   'hash'      - reading RECORD files and hashing installed files (Distros.check_files)
+# counters: 'cache_hits', 'cache_misses', 'env_cache_hits', 'env_cache_misses', 'http_requests', 'http_bytes',
+#           'http_not_modified', 'http_retries', 'files_hashed', 'hash_cache_hits'
+
+_active = None
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class Profiler:
+
+    def __init__(self, on_event=None):
+        # on_event(phase, elapsed seconds, args dict) is called after every timed phase
+        self.on_event = on_event
+        self.phases = {}
+        self.counters = {}
+        self.events = []
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def record(self, phase, start, end, args=None):
+        elapsed = end - start
+        with self._lock:
+            stats = self.phases.setdefault(phase, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            self.events.append((phase, start, elapsed, threading.get_ident(), args))
+        if self.on_event:
+            self.on_event(phase, elapsed, args or {})
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def report(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        with self._lock:
+            return {'elapsed': elapsed, 'phases': {k: dict(v) for k, v in self.phases.items()}, 'counters': dict(self.counters)}
+
+    def to_chrome_trace(self, filepath):
+        # Trace Event Format (complete events), viewable in chrome://tracing or Perfetto
+        pid = os.getpid()
+        with self._lock:
+            events = [{'name': (args or {}).get('label', phase), 'cat': phase, 'ph': 'X', 'pid': pid, 'tid': tid,
+                       'ts': (start - self.started) * 1e6, 'dur': elapsed * 1e6, 'args': args or {}}
+                      for phase, start, elapsed, tid, args in self.events]
+            end = (self.elapsed if self.elapsed is not None else time.perf_counter() - self.started) * 1e6
+            events += [{'name': name, 'ph': 'C', 'pid': pid, 'ts': end, 'args': {name: value}} for name, value in self.counters.items()]
+        with open(filepath, 'w', encoding='utf-8') as trfile:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trfile, default=str)
+
+    def __str__(self):
+        rep = self.report()
+        lines = [f'TOTAL {rep["elapsed"] * 1000:.1f} ms']
+        for phase, stats in sorted(rep['phases'].items(), key=lambda kv: -kv[1]['total']):
+            lines.append(f'  {phase:<10} {stats["total"] * 1000:10.1f} ms  x{stats["count"]:<6} (max {stats["max"] * 1000:.1f} ms)')
+        for name, value in sorted(rep['counters'].items()):
+            lines.append(f'  {name:<18} {value}')
+        return '\n'.join(lines)
+
+## ---------------------------------------------------------------------------------------------- ##
+
+@contextlib.contextmanager
+def profile(on_event=None, trace=None):
+    # collects timings and counters of everything pydistro does in the block (in all threads):
+    #   with profile(trace='trace.json') as prof: ...
+    #   prof.report()
+    global _active
+    previous = _active
+    _active = Profiler(on_event)
+    try:
+        yield _active
+    finally:
+        prof, _active = _active, previous
+        prof.stop()
+        if trace:
+            prof.to_chrome_trace(trace)
+
+@contextlib.contextmanager
+def phase(name, **args):
+    prof = _active
+    if prof is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.record(name, start, time.perf_counter(), args)
+
+def count(name, n=1):
+    if _active is not None:
+        _active.count(name, n)
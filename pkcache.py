@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+import os, abc, json, sqlite3, threading, contextlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+## ---------------------------------------------------------------------------------------------- ##
+
+# dict-like package database: {package name: package info dict};
+# backends track the changed entries, so saving costs only as much as the packages touched;
+# a backend implements the abstract methods (an incomplete one can't be instantiated)
+class PackageCache(abc.ABC):
+
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+        self._dirty = set()
+        self._lock = threading.RLock()
+
+    @abc.abstractmethod
+    def load(self):
+        pass
+
+    @abc.abstractmethod
+    def save(self, filepath=None):
+        pass
+
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def get(self, key, default=None):
+        pass
+
+    @abc.abstractmethod
+    def keys(self):
+        pass
+
+    @abc.abstractmethod
+    def __setitem__(self, key, value):
+        pass
+
+    @abc.abstractmethod
+    def __len__(self):
+        pass
+
+    def has_updated(self):
+        return bool(self._dirty)
+
+    def update(self, entries):
+        for k, v in entries.items():
+            self[k] = v
+
+    def items(self):
+        return ((k, self.get(k)) for k in self.keys())
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __bool__(self):
+        return True
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class JsonCache(PackageCache):
+
+    # the main store (pypkg.json) is only rewritten on compaction; saves append the changed entries to
+    # a journal next to it (pypkg.json-journal, one [name, info] JSON array per line), which load() replays.
+    # Saves and compactions of all processes sharing the store are serialized by a lock file (pypkg.json.lock);
+    # the compaction merges the store and the journal as they are on disk, writes a temp file and renames it over the store
+    COMPACT_MIN_BYTES = 1 << 20
+    COMPACT_RATIO = 0.5
+
+    def __init__(self, filepath):
+        super().__init__(filepath)
+        self._data = {}
+
+    @property
+    def journal(self):
+        return self.filepath + '-journal'
+
+    def load(self):
+        with self._lock, file_lock(self.filepath + '.lock'):
+            self._data = JsonCache.read_store(self.filepath)
+            self._dirty.clear()
+        return self
+
+    def save(self, filepath=None):
+        with self._lock:
+            if filepath and os.path.abspath(filepath) != self.filepath:
+                # save as: the whole cache goes to the new store (and its journal is dropped)
+                if not self._data: return False
+                self.filepath = os.path.abspath(filepath)
+                with file_lock(self.filepath + '.lock'):
+                    JsonCache.write_store(self.filepath, self._data)
+                    if os.path.isfile(self.journal):
+                        os.remove(self.journal)
+                self._dirty.clear()
+                return True
+            if not self._dirty or not self._data:
+                return False
+            lines = ''.join(json.dumps([k, self._data[k]], ensure_ascii=False, separators=(',', ':')) + '\n'
+                            for k in self._dirty if k in self._data)
+            with file_lock(self.filepath + '.lock'):
+                with open(self.journal, 'a+b') as jrfile:
+                    # a line torn by a crashed writer is ended first, so that only that line is lost
+                    jrfile.seek(0, os.SEEK_END)
+                    if jrfile.tell():
+                        jrfile.seek(-1, os.SEEK_END)
+                        if jrfile.read(1) != b'\n': lines = '\n' + lines
+                    jrfile.write(lines.encode('utf-8'))
+                    size = jrfile.tell()
+                if size > max(JsonCache.COMPACT_MIN_BYTES, JsonCache.COMPACT_RATIO * JsonCache._size(self.filepath)):
+                    self._compact()
+            self._dirty.clear()
+            return True
+
+    def compact(self):
+        # merge the journal into the main store now
+        with self._lock, file_lock(self.filepath + '.lock'):
+            return self._compact()
+
+    def _compact(self):
+        # (the lock file is held) the store and journal on disk include the entries saved by other processes
+        if not os.path.isfile(self.journal): return False
+        JsonCache.write_store(self.filepath, JsonCache.read_store(self.filepath))
+        os.remove(self.journal)
+        return True
+
+    @staticmethod
+    def read_store(filepath):
+        data = {}
+        if os.path.isfile(filepath):
+            with open(filepath, 'r', encoding='utf-8') as jsfile:
+                data = json.load(jsfile)
+        journal = filepath + '-journal'
+        if os.path.isfile(journal):
+            with open(journal, 'r', encoding='utf-8', errors='replace') as jrfile:
+                for line in jrfile:
+                    try:
+                        k, v = json.loads(line)
+                    except ValueError:
+                        continue   # torn by a crashed writer
+                    data[k] = v
+        return data
+
+    @staticmethod
+    def write_store(filepath, data):
+        tmpfile = f'{filepath}.{os.getpid()}.tmp'
+        with open(tmpfile, 'w', encoding='utf-8') as jsfile:
+            json.dump(data, jsfile, ensure_ascii=False, separators=(',', ':'))
+            jsfile.flush()
+            os.fsync(jsfile.fileno())
+        os.replace(tmpfile, filepath)
+
+    @staticmethod
+    def _size(filepath):
+        try:
+            return os.path.getsize(filepath)
+        except OSError:
+            return 0
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if self._data.get(key, None) != value:
+                self._data[key] = value
+                self._dirty.add(key)
+
+    def __len__(self):
+        return len(self._data)
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class SqliteCache(PackageCache):
+
+    def __init__(self, filepath):
+        super().__init__(filepath)
+        self._conn = None
+        self._rows = {}
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.filepath, timeout=30, check_same_thread=False)
+            # WAL lets several processes read the cache while one of them writes
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS packages (name TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            self._conn.commit()
+        return self._conn
+
+    def load(self):
+        with self._lock:
+            self._connect()
+            self._rows.clear()
+            self._dirty.clear()
+        return self
+
+    def save(self, filepath=None):
+        with self._lock:
+            conn = self._connect()
+            saved = self._flush(conn)
+            if filepath and os.path.abspath(filepath) != self.filepath:
+                target = sqlite3.connect(os.path.abspath(filepath))
+                conn.backup(target)
+                target.close()
+                saved = True
+            return saved
+
+    def _flush(self, conn):
+        if not self._dirty: return False
+        rows = [(k, json.dumps(self._rows[k], ensure_ascii=False)) for k in self._dirty]
+        with conn:
+            conn.executemany('INSERT INTO packages (name, data) VALUES (?, ?) '
+                             'ON CONFLICT(name) DO UPDATE SET data = excluded.data', rows)
+        self._dirty.clear()
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._rows:
+                row = self._connect().execute('SELECT data FROM packages WHERE name = ?', (key,)).fetchone()
+                self._rows[key] = json.loads(row[0]) if row else None
+            value = self._rows[key]
+        return default if value is None else value
+
+    def keys(self):
+        with self._lock:
+            names = [row[0] for row in self._connect().execute('SELECT name FROM packages')]
+            known = set(names)
+            names += [k for k in self._dirty if k not in known]
+        return names
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if self.get(key) != value:
+                self._rows[key] = value
+                self._dirty.add(key)
+
+    def __len__(self):
+        with self._lock:
+            count = self._connect().execute('SELECT COUNT(*) FROM packages').fetchone()[0]
+            return count + sum(1 for k in self._dirty if not self._exists(k))
+
+    def _exists(self, key):
+        return self._connect().execute('SELECT 1 FROM packages WHERE name = ?', (key,)).fetchone() is not None
+
+    def import_json(self, filepath):
+        data = JsonCache(filepath).load()._data
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany('INSERT INTO packages (name, data) VALUES (?, ?) '
+                                 'ON CONFLICT(name) DO UPDATE SET data = excluded.data',
+                                 ((k, json.dumps(v, ensure_ascii=False)) for k, v in data.items()))
+            self._rows.clear()
+        return len(data)
+
+## ---------------------------------------------------------------------------------------------- ##
+
+@contextlib.contextmanager
+def file_lock(filepath):
+    # exclusive lock held on filepath (created if missing) across processes, blocking until it is free;
+    # without write access to the directory, nothing can be saved there either and the lock is skipped
+    try:
+        lockfile = open(filepath, 'a+b')
+    except OSError:
+        yield
+        return
+    with lockfile:
+        if fcntl:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX)
+        else:
+            lockfile.seek(0)
+            msvcrt.locking(lockfile.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lockfile.fileno(), fcntl.LOCK_UN)
+            else:
+                lockfile.seek(0)
+                msvcrt.locking(lockfile.fileno(), msvcrt.LK_UNLCK, 1)
+
+## ---------------------------------------------------------------------------------------------- ##
+
+BACKENDS = {'json': (JsonCache, 'pypkg.json'), 'sqlite': (SqliteCache, 'pypkg.db')}
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os, json, gzip
+
+## ---------------------------------------------------------------------------------------------- ##
+
+# bulk sources of PyPI package info for filling the package cache without a live PyPI request per package;
+# every reader yields (package name, PyPI 'info' dict, fetch timestamp) one document at a time
+
+def _open(filepath):
+    return gzip.open(filepath, 'rt', encoding='utf-8') if filepath.endswith('.gz') else open(filepath, 'r', encoding='utf-8')
+
+def _info(doc):
+    # whole /pypi/<name>/json documents or just their 'info' dicts
+    info = doc.get('info', doc) if isinstance(doc, dict) else None
+    return info if isinstance(info, dict) and info.get('name', None) else None
+
+def read_json_dir(dirpath):
+    # a directory tree of saved /pypi/<name>/json documents: files named 'json' (as in a mirrored URL tree),
+    # '*.json' or '*.json.gz'; unreadable files are skipped
+    for root, dirs, files in os.walk(dirpath):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename != 'json' and not filename.endswith(('.json', '.json.gz')): continue
+            filepath = os.path.join(root, filename)
+            try:
+                with _open(filepath) as jsfile:
+                    info = _info(json.load(jsfile))
+            except (OSError, ValueError):
+                continue
+            if info:
+                yield info['name'], info, os.path.getmtime(filepath)
+
+def read_jsonl(filepath):
+    # one JSON document per line (optionally gzipped); invalid lines are skipped
+    fetched = os.path.getmtime(filepath)
+    with _open(filepath) as jsfile:
+        for line in jsfile:
+            line = line.strip()
+            if not line: continue
+            try:
+                info = _info(json.loads(line))
+            except ValueError:
+                continue
+            if info:
+                yield info['name'], info, fetched
+
+def read_simple_index(client, pknames, index_url=None, on_error=None):
+    # simple index pages (PEP 503/691) of the given packages, fetched concurrently by the PyPI client
+    # (keyed by the requested names: the pages carry the normalized ones)
+    for pkname, (info, validators) in client.get_simples(pknames, index_url, on_error).items():
+        if info:
+            yield pkname, info, validators['fetched']
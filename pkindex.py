@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import functools, threading
+from packaging.version import Version, InvalidVersion
+from packaging.requirements import Requirement, InvalidRequirement
+from utils import Utils
+
+## ---------------------------------------------------------------------------------------------- ##
+
+# package name -> PEP 503 normalized name, shared by all indexes (package names are few, distros many)
+_normalized = {}
+
+@functools.lru_cache(maxsize=65536)
+def parse_version(version_str):
+    # full PEP 440 version (not truncated like VersionCompare keys), None if the string isn't one
+    try:
+        return Version(version_str)
+    except (InvalidVersion, TypeError):
+        return None
+
+@functools.lru_cache(maxsize=1024)
+def parse_query(query):
+    # 'name', 'name<2', 'name>=1.26,<2', ... -> (normalized name, SpecifierSet)
+    try:
+        req = Requirement(query)
+    except InvalidRequirement as err:
+        raise Exception(f'Invalid package query "{query}": {str(err)}')
+    return Utils.normalize_name(req.name), req.specifier
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class PackageIndex:
+
+    # fleet-wide inverted index: {normalized name: {distro id: parsed version}}; the distros of each package are also
+    # grouped by version, so that a query evaluates its specifier once per distinct version instead of once per distro.
+    # distros are told apart by identity: several snapshots of one host have equal distros that are listed separately
+    def __init__(self, distros=()):
+        self.index = {}
+        self.distros = {}    # {distro id: distro}
+        self._groups = {}    # {normalized name: {version string: (parsed version, {distro id})}}
+        self._entries = {}   # {distro id: {normalized name: version string}}, as last indexed
+        # distros are reread (and so updated here) from the worker threads of Distros.sync()
+        self._lock = threading.Lock()
+        for distro in distros:
+            self.add(distro)
+
+    def add(self, distro):
+        # adds a distro or, if already indexed, applies only the changes since (added, removed and upgraded packages)
+        with self._lock:
+            self._add(distro)
+
+    update = add
+
+    def _add(self, distro):
+        key = id(distro)
+        old = self._entries.get(key, {})
+        new = {}
+        for pk in distro.packages:
+            name = _normalized.get(pk._pkname, None)
+            if name is None:
+                name = _normalized[pk._pkname] = Utils.normalize_name(pk._pkname)
+            if name not in new:
+                new[name] = pk.version
+        if old:
+            for name, version_str in old.items():
+                if new.get(name, None) != version_str:
+                    self._unlink(key, name, version_str)
+        index, groups = self.index, self._groups
+        for name, version_str in new.items():
+            if old and old.get(name, None) == version_str: continue
+            version = parse_version(version_str)
+            distros = index.get(name, None)
+            if distros is None:
+                distros = index[name] = {}
+            distros[key] = version
+            versions = groups.get(name, None)
+            if versions is None:
+                versions = groups[name] = {}
+            group = versions.get(version_str, None)
+            if group is None:
+                group = versions[version_str] = (version, set())
+            group[1].add(key)
+        self._entries[key] = new
+        self.distros[key] = distro
+        distro._fleet_indexes.add(self)
+
+    def remove(self, distro):
+        key = id(distro)
+        with self._lock:
+            for name, version_str in self._entries.pop(key, {}).items():
+                self._unlink(key, name, version_str)
+            self.distros.pop(key, None)
+        distro._fleet_indexes.discard(self)
+
+    def _unlink(self, key, name, version_str):
+        distros = self.index.get(name, {})
+        distros.pop(key, None)
+        if not distros:
+            self.index.pop(name, None)
+        groups = self._groups.get(name, {})
+        group = groups.get(version_str, None)
+        if group:
+            group[1].discard(key)
+            if not group[1]: del groups[version_str]
+        if not groups:
+            self._groups.pop(name, None)
+
+    def query(self, query):
+        # [(distro, installed version string)] of the distros having a package version matched by the query
+        # (a requirement string, e.g. 'urllib3<2'), in the order they were indexed; pre-releases match too,
+        # versions that aren't PEP 440 only match queries without a specifier
+        name, specifier = parse_query(query)
+        found = {}
+        with self._lock:
+            for version_str, (version, keys) in self._groups.get(name, {}).items():
+                if not specifier or (version is not None and specifier.contains(version, prereleases=True)):
+                    found.update(dict.fromkeys(keys, version_str))
+            return [(distro, found[key]) for key, distro in self.distros.items() if key in found]
+
+    def __contains__(self, name):
+        return Utils.normalize_name(name) in self.index
+
+    def __getitem__(self, name):
+        # [(distro, parsed version)] of the distros having the package
+        return [(self.distros[key], version) for key, version in self.index[Utils.normalize_name(name)].items()]
+
+    def __len__(self):
+        return len(self.index)
@@ -1,13 +1,26 @@
 # -*- coding: utf-8 -*-
-from typing import KeysView
-import requests, sys, os, json
-import subprocess as sp
-import concurrent.futures
-import pandas as pd
-from openpyxl import load_workbook, worksheet, styles
-import packaging.version as pkvers
-from tabulate import tabulate
-from utils import Utils
+import sys, os, time, warnings
+import concurrent.futures, functools, threading, weakref
+from utils import Utils, LazyModule
+from pypi import PyPIClient
+from instrument import profile
+import pkcache, envcache, instrument
+
+# third-party modules are only needed by the exporters, dataframes and version parsing,
+# so they are imported on first use to keep 'import pydistro' cheap
+pd = LazyModule('pandas')
+openpyxl = LazyModule('openpyxl')
+xlcell = LazyModule('openpyxl.cell')
+xlstyles = LazyModule('openpyxl.styles')
+xltable = LazyModule('openpyxl.worksheet.table')
+pkvers = LazyModule('packaging.version')
+tabulate = LazyModule('tabulate')
+depgraph = LazyModule('depgraph')
+vmatrix = LazyModule('vmatrix')
+snapshot = LazyModule('snapshot')
+pkimport = LazyModule('pkimport')
+pkindex = LazyModule('pkindex')
+drift = LazyModule('drift')
 
 ## ---------------------------------------------------------------------------------------------- ##
 
@@ -16,10 +29,18 @@ DEBUG = False
 NL = '\n'
 WORKERS = 10
 TIMEOUT = 5
+RETRIES = 3
+BACKOFF = 0.5
+PYPI_URL = 'https://pypi.org'
 REQUEST_ARGS = {}
 VERS_LEVEL = 2
+VERS_CACHE_SIZE = 65536
 CURRENT = ' (CURRENT)'
+FAST_LIST = True
 MULTI_EXECUTOR_CLASS = concurrent.futures.ThreadPoolExecutor
+ENUM_EXECUTOR_CLASS = concurrent.futures.ThreadPoolExecutor
+# None = concurrent.futures.ProcessPoolExecutor (looked up on first use: the attribute imports multiprocessing)
+HASH_EXECUTOR_CLASS = None
 
 ## ---------------------------------------------------------------------------------------------- ##
 
@@ -28,14 +49,26 @@ class VersionCompare:
     def __init__(self, level=VERS_LEVEL):
         self.level = level
 
-    def get_version(self, version_str):
+    @staticmethod
+    @functools.lru_cache(maxsize=VERS_CACHE_SIZE)
+    def parse_version(version_str, level=VERS_LEVEL):
         version_str = version_str.strip() if version_str else ''
         if not version_str: return pkvers.Version('0')
         parts = version_str.split('.')
-        if len(parts) > self.level:
-            return pkvers.Version('.'.join(parts[:self.level]))
+        if len(parts) > level:
+            return pkvers.Version('.'.join(parts[:level]))
         return pkvers.Version(version_str)
 
+    def get_version(self, version_str):
+        # already parsed keys are passed through, raw strings are parsed once per (string, level)
+        if isinstance(version_str, pkvers.Version):
+            return version_str
+        return VersionCompare.parse_version(version_str, self.level)
+
+    def get_key(self, pk):
+        # version key of a package at this level: its pre-parsed key if it was built with the same level
+        return pk.version_key if pk.vcomp.level == self.level else self.get_version(pk.version)
+
     def compare_binary(self, pk1, pk2, comp='<'):
         v_1 = self.get_version(pk1)
         v_2 = self.get_version(pk2)
@@ -64,35 +97,122 @@ class VersionCompare:
         return self.compare_binary(pk1, pk2, '==')
 
     def sort_versions(self, versions):
-        vv = list(enumerate([self.get_version(v) for v in versions]))
-        values = set(map(lambda x: x[1], vv))
-        newlist = sorted([[y for y in vv if y[1]==x] for x in values], key=lambda e: e[0][1])
-        return [tuple(x[0] for x in e) if len(e) > 1 else e[0][0] for e in newlist]
+        groups = {}
+        for i, v in enumerate(versions):
+            groups.setdefault(self.get_version(v), []).append(i)
+        return [tuple(e) if len(e) > 1 else e[0] for _, e in sorted(groups.items())]
 
     def latest_version(self, versions):
         latest = self.sort_versions(versions)[-1]
         return latest if not isinstance(latest, tuple) else None
 
 ## ---------------------------------------------------------------------------------------------- ##
-class Package:
+# settings shared by all the packages of a Packages list (see Package.__init__)
+class PackageContext:
 
-    prop_names = ['name', 'author', 'summary', 'homepage', 'latest']
+    __slots__ = ('package_cache', 'force_update', 'vcomp', 'on_error', 'no_update_cache', 'fetcher')
 
-    def __init__(self, pk, version=None, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, no_update_cache=False):
+    def __init__(self, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, no_update_cache=False, fetcher=None):
+        self.package_cache = package_cache
+        self.force_update = force_update
         self.vcomp = vcomp_or_level if isinstance(vcomp_or_level, VersionCompare) else VersionCompare(vcomp_or_level)
-        self._version = ''
-        self.normalized_version = ''
+        self.on_error = on_error
+        self.no_update_cache = no_update_cache
+        self.fetcher = fetcher
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class Package:
+
+    prop_names = ['name', 'author', 'summary', 'homepage', 'latest']
+    _fetcher = None
+    # a package holds only its name and version; the PyPI info is a reference to the record in the
+    # package cache (one per package name, shared by all distros) and the settings live in a shared context
+    __slots__ = ('_pkname', '_version', 'version_key', 'info', '_context')
+
+    def __init__(self, pk, version=None, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, no_update_cache=False, pypi_info=None, fetcher=None, context=None):
+        self._context = context or PackageContext(package_cache, force_update, vcomp_or_level, on_error, no_update_cache, fetcher)
+        self.info = None
         if not isinstance(pk, Package):
-            self._pkname = pk.lower()
+            self._pkname = sys.intern(pk if pk.islower() else pk.lower())
             self.version = version
         else:
-            self._pkname = pk.name
+            self._pkname = pk._pkname
             self.version = pk.version
-        self.on_error = on_error
-        self.package_cache = package_cache
-        self.force_update = force_update
-        self.no_update_cache = no_update_cache
-        self.update_properties(pk.asdict(False) if isinstance(pk, Package) else None)
+        self.update_properties(pk.info if isinstance(pk, Package) else None, pypi_info)
+
+    def __getattr__(self, attr):
+        # PyPI info fields (author, summary, homepage, latest, ...) are read from the shared info record
+        try:
+            info = object.__getattribute__(self, 'info')
+        except AttributeError:
+            info = None
+        if info and attr in info:
+            return info[attr]
+        raise AttributeError(f"'Package' object has no attribute '{attr}'")
+
+    @property
+    def name(self):
+        return self.info.get('name', self._pkname) if self.info else self._pkname
+
+    @property
+    def vcomp(self):
+        return self._context.vcomp
+
+    @property
+    def package_cache(self):
+        return self._context.package_cache
+
+    @property
+    def force_update(self):
+        return self._context.force_update
+
+    @property
+    def on_error(self):
+        return self._context.on_error
+
+    @property
+    def no_update_cache(self):
+        return self._context.no_update_cache
+
+    @property
+    def fetcher(self):
+        return self._context.fetcher
+
+    @staticmethod
+    def default_fetcher():
+        if Package._fetcher is None:
+            Package._fetcher = PyPIClient(PYPI_URL, WORKERS, TIMEOUT, RETRIES, BACKOFF, REQUEST_ARGS)
+        return Package._fetcher
+
+    @staticmethod
+    def needs_update(pkinf, force_update=False):
+        # force_update is either a bool or a TTL in hours (refresh entries fetched earlier than that)
+        if force_update is True or not pkinf or not pkinf.get('homepage', '') or not pkinf.get('latest', ''):
+            return True
+        if not force_update:
+            return False
+        return time.time() - pkinf.get('fetched', 0) > force_update * 3600
+
+    @staticmethod
+    def get_validators(pkinf):
+        return (pkinf.get('etag', None), pkinf.get('modified', None)) if pkinf else (None, None)
+
+    @staticmethod
+    def merge_info(pkname, inf, pkinf=None, validators=None):
+        pkinf = pkinf or {}
+        if inf is None:
+            # 304 Not Modified: keep the cached record, only refresh the validators
+            pkinf = pkinf.copy()
+        else:
+            pkinf = {'name': inf.get('name', '') or pkinf.get('name', '') or pkname,
+                     'author': inf.get('author', '') or pkinf.get('author', ''),
+                     'summary': inf.get('summary', '') or pkinf.get('summary', ''),
+                     'homepage': inf.get('home_page', '') or inf.get('project_url', '') or pkinf.get('homepage', '') or inf.get('package_url', ''),
+                     'latest': inf.get('version', '') or pkinf.get('latest', '')}
+        if validators:
+            pkinf.update(validators)
+        return pkinf
 
     @property
     def version(self):
@@ -100,20 +220,20 @@ class Package:
 
     @version.setter
     def version(self, value):
-        self._version = value
-        self.normalized_version = str(self.vcomp.get_version(value))
+        self._version = sys.intern(value) if isinstance(value, str) else value
+        self.version_key = self.vcomp.get_version(value)
+
+    @property
+    def normalized_version(self):
+        return str(self.version_key)
 
     def _properties_set(self):
-        return all(p in self.__dict__ for p in Package.prop_names)
+        return bool(self.info) and all(p in self.info for p in Package.prop_names)
 
-    def _get_pkg_info(self):
+    def _get_pkg_info(self, pkinf=None):
         try:
-            res = requests.get('https://pypi.org/pypi/{}/json'.format(self._pkname),
-                            headers={'Accept': 'application/json'}, timeout=TIMEOUT, **REQUEST_ARGS)
-            if res.status_code != 200:
-                raise Exception(f'HTTP Error {res.status_code}!{NL}{res.text}')
-            resjs = json.loads(res.content)
-            return resjs['info']
+            with instrument.phase('fetch', label=f'PyPI {self._pkname}'):
+                return (self.fetcher or Package.default_fetcher()).get_info(self._pkname, *Package.get_validators(pkinf))
 
         except Exception as err:
             if self.on_error:
@@ -121,21 +241,22 @@ class Package:
             else:
                 raise
 
-        return dict()
+        return dict(), None
 
-    def update_properties(self, pkinf=None):
+    def update_properties(self, pkinf=None, pypi_info=None):
         if DEBUG: print(f'>> PACKAGE "{self._pkname}": UPDATING DATA ...')
-        pkinf = pkinf or (self.package_cache.get(self._pkname, None) if self.package_cache else None)
-
-        if self.force_update or pkinf is None or not pkinf.get('homepage', '') or not pkinf.get('latest', ''):
-            if DEBUG: print(f'       >> PACKAGE "{self._pkname}": NO DATA FOUND IN CACHE OR FORCED UPDATE! GETTING DATA FROM PYPI ...')
-            inf = self._get_pkg_info()
-            if DEBUG: print(f'       << PACKAGE "{self._pkname}": PYPI DATA FETCHED')
-            pkinf = {'name': inf.get('name', '') or pkinf.get('name', self._pkname) if pkinf else self._pkname,
-                     'author': inf.get('author', '') or pkinf.get('author', self._pkname) if pkinf else '',
-                     'summary': inf.get('summary', '') or pkinf.get('summary', self._pkname) if pkinf else '',
-                     'homepage': inf.get('home_page', inf.get('project_url', inf.get('package_url', ''))) or pkinf.get('homepage', self._pkname) if pkinf else '',
-                     'latest': inf.get('version', '') or pkinf.get('latest', self._pkname) if pkinf else ''}
+        pkinf = pkinf or (self.package_cache.get(self._pkname, None) if self.package_cache is not None else None)
+
+        # pypi_info is an (info, validators) pair already fetched in a batch (see Packages._collect_packages)
+        if pypi_info is not None or Package.needs_update(pkinf, self.force_update):
+            if pypi_info is None:
+                instrument.count('cache_misses')
+                if DEBUG: print(f'       >> PACKAGE "{self._pkname}": NO DATA FOUND IN CACHE OR FORCED UPDATE! GETTING DATA FROM PYPI ...')
+                pypi_info = self._get_pkg_info(pkinf)
+                if DEBUG: print(f'       << PACKAGE "{self._pkname}": PYPI DATA FETCHED')
+            pkinf = Package.merge_info(self._pkname, pypi_info[0], pkinf, pypi_info[1])
+        else:
+            instrument.count('cache_hits')
 
         if not pkinf:
             if self.on_error:
@@ -143,22 +264,25 @@ class Package:
             else:
                 raise Exception(f'Package {self._pkname} not found on PyPI!')
 
-        self.__dict__.update(pkinf)
-
-        if not self.no_update_cache and self.package_cache and self.package_cache.get(self._pkname, {}) != pkinf:
+        cached = self.package_cache.get(self._pkname, None) if self.package_cache is not None else None
+        if cached == pkinf:
+            # share the cached record instead of keeping an equal copy
+            pkinf = cached
+        elif not self.no_update_cache and self.package_cache is not None:
             self.package_cache.update({self._pkname: pkinf})
+        self.info = pkinf or None
 
         if DEBUG: print(f'<< PACKAGE "{self._pkname}": DATA UPDATED')
 
     def asdict(self, name_as_key=True):
         if not self._properties_set():
             self.update_properties()
-        inf = {k: v for k, v in self.__dict__.items() if k in Package.prop_names}
+        inf = {k: v for k, v in (self.info or {}).items() if k in Package.prop_names}
         inf['version'] = self._version
         return {self._pkname: inf} if name_as_key else inf
 
-    def is_outdated(self):
-        return self.vcomp.compare_binary(self._version, getattr(self, 'latest', ''))
+    def is_outdated(self, vcomp=None):
+        return (vcomp or self.vcomp).compare_binary(self._version, self.info.get('latest', '') if self.info else '')
 
     def install(self, pyexe=None, upgrade=True, force_version=None):
         if DEBUG: print(f'>> PACKAGE "{self._pkname}": INSTALLING ...')
@@ -188,7 +312,9 @@ class Package:
             args.append('--verbose')
         return Utils.pip(args, self._pkname, pyexe, self.on_error)
 
-    def required_by(self, pyexe=None):
+    def required_by(self, pyexe=None, graph=None):
+        if graph is not None:
+            return graph.required_by(self._pkname) or None
         res = self.show(pyexe)
         if not 'Required-by:' in str(res):
             return None
@@ -199,7 +325,9 @@ class Package:
                 return [p.strip() for p in line_.split(',')]
         return None
 
-    def requires(self, pyexe=None):
+    def requires(self, pyexe=None, graph=None):
+        if graph is not None:
+            return graph.requires(self._pkname) or None
         res = self.show(pyexe)
         if not 'Requires:' in str(res):
             return None
@@ -231,92 +359,151 @@ class Dframe:
 
     def to_xl(self, filepath='pk.xlsx', df=None):
         df = df if not df is None else self.asdataframe()
-        if DEBUG: print(f'>> OUTPUTTING TO EXCEL ("{filepath}") ...')
-        df.to_excel(filepath, index_label='packages')
-        if DEBUG: print(f'<< SAVED TO EXCEL ("{filepath}")')
+        with instrument.phase('export', label='xlsx'):
+            if DEBUG: print(f'>> OUTPUTTING TO EXCEL ("{filepath}") ...')
+            df.to_excel(filepath, index_label='packages')
+            if DEBUG: print(f'<< SAVED TO EXCEL ("{filepath}")')
+
+    def _write_xl(self, filepath, df, cell_styles=None):
+        # one-pass streaming export formatted as a table; cell_styles is an optional list (one per row)
+        # of {column number in df: named style} dicts computed from the dataframe beforehand
+        ROWS = len(df) + 1
+        COLS = len(df.columns) + 1
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet()
+
+        # adjust col widths
+        COLW = {'A': 27, 'B': 18, 'C': 35, 'D': 77, 'E': 44, 'F': 16}
+        for i in range(7, COLS + 1):
+            COLW[Utils.num2az(i)] = 16
+        for c in COLW:
+            ws.column_dimensions[c].width = COLW[c]
+
+        headers = ['packages'] + [str(c) for c in df.columns]
+        ws.append(headers)
+
+        # rows: first column aligned left, empty values left blank
+        left = xlstyles.Alignment(horizontal='left')
+        for i, (index, values) in enumerate(zip(df.index, df.itertuples(index=False, name=None))):
+            first = xlcell.WriteOnlyCell(ws, index)
+            first.alignment = left
+            row = [first]
+            row_styles = cell_styles[i] if cell_styles else None
+            for j, value in enumerate(values):
+                value = None if value is None or value == '' or (isinstance(value, float) and value != value) else value
+                if row_styles and j in row_styles:
+                    cell = xlcell.WriteOnlyCell(ws, value)
+                    cell.style = row_styles[j]
+                    row.append(cell)
+                else:
+                    row.append(value)
+            ws.append(row)
+
+        # format as table
+        tab = xltable.Table(displayName='Table1', ref=f'A1:{Utils.num2az(COLS)}{ROWS}')
+        tab.tableStyleInfo = xltable.TableStyleInfo(name='TableStyleMedium8', showFirstColumn=False,
+                                                            showLastColumn=False, showRowStripes=False, showColumnStripes=False)
+        # write-only sheets can't be read back, so the table columns are declared explicitly
+        tab.tableColumns = [xltable.TableColumn(id=i, name=h) for i, h in enumerate(headers, 1)]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            ws.add_table(tab)
+        wb.save(filepath)
 
     def to_csv(self, filepath='pk.csv', df=None, sep=';'):
         df = df if not df is None else self.asdataframe()
-        if DEBUG: print(f'>> OUTPUTTING TO CSV ("{filepath}") ...')
-        df.to_csv(filepath, sep=sep, index=False)
-        if DEBUG: print(f'<< SAVED TO CSV ("{filepath}")')
+        with instrument.phase('export', label='csv'):
+            if DEBUG: print(f'>> OUTPUTTING TO CSV ("{filepath}") ...')
+            df.to_csv(filepath, sep=sep, index=False)
+            if DEBUG: print(f'<< SAVED TO CSV ("{filepath}")')
 
     def to_html(self, filepath='pk.html', df=None):
         df = df if not df is None else self.asdataframe()
-        if DEBUG: print(f'>> OUTPUTTING TO HTML ("{filepath}") ...')
-        with open(filepath, 'w', encoding='utf-8') as file_:
-            file_.write(df.to_html(na_rep='', index=False, render_links=True))
-        if DEBUG: print(f'<< SAVED TO HTML ("{filepath}")')
+        with instrument.phase('export', label='html'):
+            if DEBUG: print(f'>> OUTPUTTING TO HTML ("{filepath}") ...')
+            with open(filepath, 'w', encoding='utf-8') as file_:
+                file_.write(df.to_html(na_rep='', index=False, render_links=True))
+            if DEBUG: print(f'<< SAVED TO HTML ("{filepath}")')
 
     def to_json(self, filepath='pk.json', df=None):
         df = df if not df is None else self.asdataframe()
-        if DEBUG: print(f'>> OUTPUTTING TO JSON ("{filepath}") ...')
-        with open(filepath, 'w', encoding='utf-8') as file_:
-            file_.write(df.to_json(orient='index', indent=2))
-        if DEBUG: print(f'<< SAVED TO JSON ("{filepath}")')
+        with instrument.phase('export', label='json'):
+            if DEBUG: print(f'>> OUTPUTTING TO JSON ("{filepath}") ...')
+            with open(filepath, 'w', encoding='utf-8') as file_:
+                file_.write(df.to_json(orient='index', indent=2))
+            if DEBUG: print(f'<< SAVED TO JSON ("{filepath}")')
 
     def to_pickle(self, filepath='pk.gz', df=None, compression='infer'):
         df = df if not df is None else self.asdataframe()
-        if DEBUG: print(f'>> OUTPUTTING TO PICKLE ("{filepath}") ...')
-        df.to_pickle(filepath, compression=compression)
-        if DEBUG: print(f'<< SAVED TO PICKLE ("{filepath}")')
+        with instrument.phase('export', label='pickle'):
+            if DEBUG: print(f'>> OUTPUTTING TO PICKLE ("{filepath}") ...')
+            df.to_pickle(filepath, compression=compression)
+            if DEBUG: print(f'<< SAVED TO PICKLE ("{filepath}")')
 
     def to_clipboard(self, df=None, excel=True, sep=None):
         df = df if not df is None else self.asdataframe()
-        df.to_clipboard(excel, sep, index=False, na_rep='')
-        if DEBUG: print('<< SAVED TO CLIPBOARD')
+        with instrument.phase('export', label='clipboard'):
+            df.to_clipboard(excel, sep, index=False, na_rep='')
+            if DEBUG: print('<< SAVED TO CLIPBOARD')
 
     def to_string(self, df=None):
         df = df if not df is None else self.asdataframe()
-        return df.to_string(index=False, na_rep='')
+        with instrument.phase('export', label='string'):
+            return df.to_string(index=False, na_rep='')
 
     def to_stringx(self, df=None, tablefmt='fancy_grid', maxwidth=200, filepath=None, **kwargs):
         df = df if not df is None else self.asdataframe()
-        if maxwidth:
-            maxcolw = maxwidth // len(df.columns)
-            df = df.transform(lambda x: x.str.wrap(maxcolw))
-        kwargs = kwargs or {}
-        if tablefmt:
-            kwargs['tablefmt'] = tablefmt
-        kwargs['headers'] = 'keys'
-        kwargs['showindex'] = False
-        if not 'stralign' in kwargs:
-            kwargs['stralign'] = 'left'
-        s = tabulate(df, **kwargs)
-        if filepath:
-            if DEBUG: print(f'>> OUTPUTTING TO TEXT FILE ("{filepath}") ...')
-            with open(filepath, 'w', encoding='utf-8') as file_:
-                file_.write(s)
-            if DEBUG: print(f'<< SAVED TO TEXT FILE ("{filepath}")')
-        return s
+        with instrument.phase('export', label='stringx'):
+            if maxwidth:
+                maxcolw = maxwidth // len(df.columns)
+                df = df.transform(lambda x: x.str.wrap(maxcolw))
+            kwargs = kwargs or {}
+            if tablefmt:
+                kwargs['tablefmt'] = tablefmt
+            kwargs['headers'] = 'keys'
+            kwargs['showindex'] = False
+            if not 'stralign' in kwargs:
+                kwargs['stralign'] = 'left'
+            s = tabulate.tabulate(df, **kwargs)
+            if filepath:
+                if DEBUG: print(f'>> OUTPUTTING TO TEXT FILE ("{filepath}") ...')
+                with open(filepath, 'w', encoding='utf-8') as file_:
+                    file_.write(s)
+                if DEBUG: print(f'<< SAVED TO TEXT FILE ("{filepath}")')
+            return s
 
 ## ---------------------------------------------------------------------------------------------- ##
 
 class Packages(Dframe):
 
-    def __init__(self, packages=None, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None):
+    def __init__(self, packages=None, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, fetcher=None, infos=None):
+        # infos: PyPI info already fetched for (some of) the packages, see fetch_missing()
         self.package_cache = package_cache
-        full_packages = packages and isinstance(packages[0], Package)
+        self.fetcher = fetcher
+        full_packages = bool(packages) and isinstance(packages[0], Package)
         if full_packages:
             self.packages = packages.copy()
             self._pknames = [pk.name for pk in self.packages]
+        elif packages is None:
+            self._pknames = list(self.package_cache.keys()) if self.package_cache is not None else []
+            self.packages = []
         else:
-            self._pknames = list(pk for pk in packages) or (list(self.package_cache.keys()) if self.package_cache else [])
+            self._pknames = list(pk for pk in packages)
             self.packages = []
         self.on_error = on_error
         self.force_update = force_update
         self.vcomp = vcomp_or_level if isinstance(vcomp_or_level, VersionCompare) else VersionCompare(vcomp_or_level)
         self._it = None
+        self._index = None
+        self._index_sig = None
         if not full_packages:
-            self._collect_packages()        
+            self._collect_packages(infos=infos)
 
     def get(self, key):
         if isinstance(key, int):
             return self.packages[key]
-        for pk in self.packages:
-            if pk.name.lower() == key.lower():
-                return pk
-        return None
+        self.get_index()
+        return self._lookup.get(Utils.normalize_name(key), None)
 
     def asdict(self):
         ds = {}
@@ -326,49 +513,24 @@ class Packages(Dframe):
 
     # overloaded from DFrame
     def asdataframe(self):
-        pkdict = self.asdict()
-        if pkdict:
-            df = pd.DataFrame.from_dict(pkdict, orient='index')
-            return df.reindex(sorted(df.index, key=lambda x: x.lower()))
+        with instrument.phase('dataframe', label=f'packages ({len(self.packages)})'):
+            pkdict = self.asdict()
+            if pkdict:
+                df = pd.DataFrame.from_dict(pkdict, orient='index')
+                return df.reindex(sorted(df.index, key=lambda x: x.lower()))
         return None
 
     # overloaded from DFrame
     def to_xl(self, filepath='pk.xlsx', df=None):
         df = df if not df is None else self.asdataframe()
-        ROWS = len(df) + 1
-        COLS = len(df.columns) + 1
-        try:
-            if DEBUG: print(f'OUTPUTTING TO EXCEL ("{filepath}") ...')
-            df.to_excel(filepath, index_label='packages')
-            wb = load_workbook(filename=filepath)
-            ws = wb.active
-
-            # align first column left
-            for col in ws.iter_cols(max_col=1, min_row=2, max_row=ROWS):
-                for cell in col:
-                    cell.alignment = styles.Alignment(horizontal='left')
-
-            # format as table
-            tab = worksheet.table.Table(displayName='Table1', ref=f'a1:{Utils.num2az(COLS)}{ROWS}')
-            tab.tableStyleInfo = worksheet.table.TableStyleInfo(name='TableStyleMedium8', showFirstColumn=False,
-                                                                showLastColumn=False, showRowStripes=False, showColumnStripes=False)
-            if 'Table1' in ws.tables:
-                del ws.tables['Table1']
-            ws.add_table(tab)
-
-            # adjust col widths
-            COLW = {'a': 27, 'b': 18, 'c': 35, 'd': 77, 'e': 44, 'f': 16}
-            for i in range(7, COLS + 1):
-                COLW[Utils.num2az(i)] = 16
-            for c in COLW:
-                ws.column_dimensions[c].width = COLW[c]
+        with instrument.phase('export', label='xlsx'):
+            try:
+                if DEBUG: print(f'OUTPUTTING TO EXCEL ("{filepath}") ...')
+                self._write_xl(filepath, df)
+                if DEBUG: print(f'SAVED TO EXCEL ("{filepath}")')
 
-            # save workbook
-            wb.save(filename=filepath)
-            if DEBUG: print(f'SAVED TO EXCEL ("{filepath}")')
-
-        except Exception as err:
-            print(err)
+            except Exception as err:
+                print(err)
 
     def get_fullunion(self, other):
         return self._concat_from(other, '+')
@@ -416,7 +578,7 @@ class Packages(Dframe):
     def list_uptodate(self):
         return (pk for pk in self.packages if not pk.is_outdated(self.vcomp))
 
-    def install(self, packages=None, pyexe=None, upgrade=True, force_version=False, on_install=None):
+    def install(self, packages=None, pyexe=None, upgrade=True, force_version=False, on_install=None, chunk_size=1):
         packages = packages or self.packages
         if not packages: return
         if not isinstance(packages[0], Package):
@@ -424,13 +586,24 @@ class Packages(Dframe):
             self._collect_packages(packages, packages_)
             packages = packages_
         if DEBUG: print(f'>> INSTALLING PACKAGES ({len(packages)}) ...')
-        for pk in packages:
-            res = pk.install(pyexe, upgrade, pk.version if force_version and pk.version else None)
-            if on_install:
-                on_install(pk, res)
+        if chunk_size == 1:
+            outs = []
+            for pk in packages:
+                res = pk.install(pyexe, upgrade, pk.version if force_version and pk.version else None)
+                outs.append(res)
+                if on_install:
+                    on_install(pk, res)
+        else:
+            # pinned packages need --force-reinstall, so they go to separate pip runs
+            args = ['install'] + (['--upgrade'] if upgrade else [])
+            pinned = [pk for pk in packages if force_version and pk.version]
+            unpinned = [pk for pk in packages if not (force_version and pk.version)]
+            outs = self._pip_batch(args, unpinned, lambda pk: pk.name, pyexe, chunk_size, on_install)
+            outs += self._pip_batch(args + ['--force-reinstall'], pinned, lambda pk: f'{pk.name}=={pk.version}', pyexe, chunk_size, on_install)
         if DEBUG: print('<< INSTALLATION COMPLETE')
+        return NL.join(out for out in outs if out)
 
-    def uninstall(self, packages=None, pyexe=None, on_uninstall=None):
+    def uninstall(self, packages=None, pyexe=None, on_uninstall=None, chunk_size=1):
         packages = packages or self.packages
         if not packages: return
         if not isinstance(packages[0], Package):
@@ -438,11 +611,42 @@ class Packages(Dframe):
             self._collect_packages(packages, packages_)
             packages = packages_
         if DEBUG: print(f'>> UNINSTALLING PACKAGES ({len(packages)}) ...')
-        for pk in packages:
-            res = pk.uninstall(pyexe)
-            if on_uninstall:
-                on_uninstall(pk, res)
+        if chunk_size == 1:
+            outs = []
+            for pk in packages:
+                res = pk.uninstall(pyexe)
+                outs.append(res)
+                if on_uninstall:
+                    on_uninstall(pk, res)
+        else:
+            outs = self._pip_batch(['uninstall', '--yes'], packages, lambda pk: pk.name, pyexe, chunk_size, on_uninstall)
         if DEBUG: print('<< UNINSTALLATION COMPLETE')
+        return NL.join(out for out in outs if out)
+
+    def _pip_batch(self, args, packages, spec, pyexe=None, chunk_size=None, on_package=None):
+        # one pip run per chunk of packages (chunk_size = None or 0: all in one run);
+        # each package gets the lines of pip's output that concern it
+        if not packages: return []
+        chunk_size = chunk_size or len(packages)
+        outs = []
+        for i in range(0, len(packages), chunk_size):
+            chunk = packages[i:i + chunk_size]
+            failed = {}
+
+            def on_error(err):
+                failed.update(err)
+                self.on_error(err)
+
+            if DEBUG: print(f'   >> PIP {args[0].upper()}: {len(chunk)} PACKAGES ...')
+            # without an error handler a failed run raises, as with one pip run per package
+            res = Utils.pip(args + [spec(pk) for pk in chunk], None, pyexe, on_error if self.on_error else None)
+            out = res if res is not None else failed.get('stdout', None)
+            outs.append(out)
+            if on_package:
+                parts = Utils.split_pip_output(out, [pk.name for pk in chunk])
+                for pk in chunk:
+                    on_package(pk, parts[pk.name])
+        return outs
 
     def check(self, packages=None, pyexe=None):
         packages = packages or self.packages
@@ -453,72 +657,101 @@ class Packages(Dframe):
             packages = packages_
         return Utils.pip(['check'] + [pk.name for pk in packages], None, pyexe, self.on_error)
 
-    def _collect_packages(self, pknames=None, packages=None):
+    def fetch_missing(self, pknames, force_update=None):
+        force_update = self.force_update if force_update is None else force_update
+        cache = self.package_cache if self.package_cache is not None else {}
+        with instrument.phase('cache', label=f'lookup ({len(pknames)} packages)'):
+            missing = [pkname.lower() for pkname in pknames if Package.needs_update(cache.get(pkname.lower(), None), force_update)]
+        # (hits are counted as the packages get constructed)
+        instrument.count('cache_misses', len(missing))
+        if not missing: return {}
+        if DEBUG: print(f'>> FETCHING PYPI DATA FOR {len(missing)} PACKAGES ...')
+        validators = {pkname: Package.get_validators(cache.get(pkname, None)) for pkname in missing}
+        infos = (self.fetcher or Package.default_fetcher()).get_infos(missing, self.on_error, validators=validators)
+        if DEBUG: print(f'<< FETCHED PYPI DATA FOR {len(infos)} PACKAGES')
+        return infos
+
+    def _collect_packages(self, pknames=None, packages=None, infos=None):
         pknames = pknames if pknames else self._pknames
         if not pknames: return
-        packages = packages if packages else self.packages
+        packages = packages if packages is not None else self.packages
         if not isinstance(packages, list): return
 
         packages.clear()
-        has_versions = Utils.is_iterable(pknames[0])
-
-        def worker(pkname, version):
-            pk = Package(pkname, version, self.package_cache, force_update=self.force_update, vcomp_or_level=self.vcomp, on_error=self.on_error)
-            packages.append(pk)
-
-        if DEBUG: print(f'>> COLLECTING PACKAGE INFO FOR {len(packages)} PACKAGES ...')
-        with MULTI_EXECUTOR_CLASS(max_workers=WORKERS) as executor:
-            futures = {executor.submit(worker, pkname, version): pkname for pkname, version in pknames} if has_versions else \
-                      {executor.submit(worker, pkname, None): pkname for pkname in pknames}
-            for future in concurrent.futures.as_completed(futures):
-                pkname = futures[future]
+        # names and (name, version) pairs can be mixed, e.g. ['requests', ('numpy', '1.26.4')]
+        pknames = [pkname if Utils.is_iterable(pkname) else (pkname, None) for pkname in pknames]
+
+        if DEBUG: print(f'>> COLLECTING PACKAGE INFO FOR {len(pknames)} PACKAGES ...')
+        # all PyPI requests go out in one pooled batch (unless done by the caller), so building the packages is cache-only
+        infos = self.fetch_missing([pkname for pkname, _ in pknames]) if infos is None else infos
+        context = PackageContext(self.package_cache, self.force_update, self.vcomp, self.on_error, fetcher=self.fetcher)
+        with instrument.phase('construct', label=f'packages ({len(pknames)})', packages=len(pknames)):
+            for pkname, version in pknames:
                 try:
-                    pk = future.result()
+                    pk = Package(pkname, version, pypi_info=infos.get(pkname.lower(), None), context=context)
+                    packages.append(pk)
                     if DEBUG: print(f'     << COLLECTED PACKAGE {str(pk)}')
                 except Exception as err:
                     if self.on_error:
                         self.on_error(f'{pkname}: {str(err)}')
         if DEBUG: print(f'<< COLLECTED PACKAGE INFO FOR {len(packages)} PACKAGES')
 
+    def get_index(self):
+        # name -> [packages] index (and the PEP 503 normalized name -> first package lookup used by get()),
+        # rebuilt only when the package list has been replaced or resized
+        sig = (id(self.packages), len(self.packages))
+        if self._index is None or self._index_sig != sig:
+            index = {}
+            lookup = {}
+            for pk in self.packages:
+                index.setdefault(pk.name, []).append(pk)
+                lookup.setdefault(Utils.normalize_name(pk._pkname), pk)
+            self._index, self._lookup, self._index_sig = index, lookup, sig
+        return self._index
+
     def _get_merged(self, other, op='+'):
         if op=='+':
             return list(set(self.packages + other.packages))
 
         elif op=='-':
+            # newer or unique packages: compare with the first package of the same name in other
+            index = other.get_index()
             ps = []
             for pk1 in self.packages:
-                for pk2 in other.packages:
-                    if pk1.name == pk2.name:
-                        if self.vcomp.compare_binary(pk1.version, pk2.version, '>'):
-                            ps.append(pk1)
-                        break
-                else:
+                pks2 = index.get(pk1.name, None)
+                if not pks2 or self.vcomp.get_key(pk1) > self.vcomp.get_key(pks2[0]):
                     ps.append(pk1)
             return ps
 
         elif op=='&':
+            index = other.get_index()
             ps = []
             for pk1 in self.packages:
-                for pk2 in other.packages:
-                    if pk1.name == pk2.name and self.vcomp.is_equal(pk1.version, pk2.version):
-                        ps.append(pk1)
-                        break
+                v_1 = self.vcomp.get_key(pk1)
+                if any(v_1 == self.vcomp.get_key(pk2) for pk2 in index.get(pk1.name, ())):
+                    ps.append(pk1)
             return ps
 
         elif op=='|':
+            # same-name packages are paired in order, the newer one of each pair wins
+            pending = {}
+            for i, pk2 in enumerate(other.packages):
+                pending.setdefault(pk2.name, []).append(i)
+            cursors = {}
+            taken = set()
             ps = []
-            other_ = other.packages.copy()
             for pk1 in self.packages:
-                for pk2 in other_:
-                    if pk1.name == pk2.name:
-                        cmp = self.vcomp.compare_binary_reverse(pk1.version, pk2.version)
-                        pk = pk1 if cmp != '<' else pk2
-                        ps.append(pk)
-                        other_.remove(pk2)
-                        break
+                idxs = pending.get(pk1.name, None)
+                cur = cursors.get(pk1.name, 0)
+                if idxs and cur < len(idxs):
+                    i = idxs[cur]
+                    cursors[pk1.name] = cur + 1
+                    taken.add(i)
+                    pk2 = other.packages[i]
+                    ps.append(pk1 if not self.vcomp.get_key(pk1) < self.vcomp.get_key(pk2) else pk2)
                 else:
                     ps.append(pk1)
-            ps += other_
+            ps += [pk2 for i, pk2 in enumerate(other.packages) if i not in taken]
             return ps
 
         elif op=='^':
@@ -530,7 +763,7 @@ class Packages(Dframe):
             raise Exception(f'Wrong operator: {op}')
 
     def _concat_from(self, other, op='+'):
-        return Packages(self._get_merged(other, op), self.force_update, self.vcomp, self.on_error)
+        return Packages(self._get_merged(other, op), self.package_cache, self.force_update, self.vcomp, self.on_error, self.fetcher)
 
     def __repr__(self):
         return str(self.asdict())
@@ -592,75 +825,248 @@ class Distro(Packages):
     def get_pyexe(pyexe):
         return os.path.abspath(pyexe) if pyexe else sys.executable
 
-    def __init__(self, pyexe=None, alias=None, package_cache=None, append_to_current=CURRENT, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None):
+    def __init__(self, pyexe=None, alias=None, package_cache=None, append_to_current=CURRENT, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, fetcher=None,
+                 listing=None, infos=None):
+        # listing: the enumerate_env() result for pyexe, if already read; infos: see Packages
         self.append_to_current = append_to_current
         self.pyexe = Distro.get_pyexe(pyexe)
+        self.env = listing[0] if listing else None
+        self.fingerprint = listing[1] if listing else None
+        self._depgraph = None
+        # fleet indexes (Distros.package_index()) holding this distro, updated when it is reread
+        self._fleet_indexes = weakref.WeakSet()
+        self.host = None
         self.alias = alias or f'{self._get_env_version()}'
         if self.append_to_current and self.pyexe == sys.executable:
             self.alias += self.append_to_current
         self.on_error = on_error
-        super().__init__(self._list_env_packages(), package_cache, force_update, vcomp_or_level, on_error)        
+        super().__init__(listing[2] if listing else self._list_env_packages(), package_cache, force_update, vcomp_or_level, on_error, fetcher, infos)
         if not getattr(self, 'packages', None):
             raise Exception(f'Unable to get packages from environment "{self.pyexe}"!')
 
-    def reread(self):
-        self._pknames = self._list_env_packages()
-        self._collect_packages()
+    @classmethod
+    def from_snapshot(cls, record, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, fetcher=None):
+        # distro rebuilt from a snapshot record (see snapshot.py) without running its interpreter
+        distro = cls.__new__(cls)
+        distro.append_to_current = None
+        distro.pyexe = record['pyexe']
+        distro.env = record.get('env', None) or {}
+        distro.fingerprint = record.get('fingerprint', None)
+        distro._depgraph = None
+        distro._fleet_indexes = weakref.WeakSet()
+        distro.host = record.get('host', None)
+        distro.alias = record['alias']
+        distro.on_error = on_error
+        Packages.__init__(distro, list(zip(*record['packages'])), package_cache, force_update, vcomp_or_level, on_error, fetcher)
+        return distro
+
+    @classmethod
+    def load_snapshot(cls, filepath, package_cache=None, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=None, fetcher=None):
+        # the first distro in the snapshot; package info missing from the cache (or older) is taken from the snapshot
+        data = snapshot.read(filepath)
+        if not data['distros']:
+            raise Exception(f'No distros in snapshot "{filepath}"!')
+        package_cache = Distro.merge_snapshot_info(data['info'], package_cache)
+        return cls.from_snapshot(data['distros'][0], package_cache, force_update, vcomp_or_level, on_error, fetcher)
+
+    @staticmethod
+    def merge_snapshot_info(info, package_cache=None):
+        package_cache = package_cache if package_cache is not None else {}
+        for pkname, pkinf in info.items():
+            cached = package_cache.get(pkname, None)
+            if not cached or cached.get('fetched', 0) < pkinf.get('fetched', 0):
+                package_cache[pkname] = pkinf
+        return package_cache
 
-    def install(self, on_install=None):
+    @staticmethod
+    def snapshot_info(distros):
+        return {pk._pkname: pk.info for d in distros for pk in d.packages if pk.info}
+
+    def snapshot(self):
+        return {'pyexe': self.pyexe, 'alias': self.alias, 'host': self.host or snapshot.local_host(),
+                'env': self._probe_env(), 'fingerprint': self.fingerprint,
+                'packages': [[pk._pkname for pk in self.packages], [pk.version for pk in self.packages]]}
+
+    def save_snapshot(self, filepath):
+        return snapshot.write(filepath, [self.snapshot()], Distro.snapshot_info([self]))
+
+    def is_local(self):
+        # False for distros loaded from snapshots of other hosts: their paths mean nothing on this machine
+        return not self.host or self.host == snapshot.local_host()
+
+    def _require_local(self, action):
+        if not self.is_local():
+            raise Exception(f'Unable to {action} distro {str(self)}: it is a snapshot of another host!')
+
+    def reread(self, full=False):
+        # incremental by default: only the distributions added, removed or changed since the last read
+        # are processed; returns {'added': [...], 'removed': [...], 'upgraded': [...]} package names
+        self._require_local('reread')
+        self._depgraph = None
+        self._index = None
+        if full or not FAST_LIST or self.fingerprint is None:
+            self.env = None
+            self.fingerprint = None
+            self._pknames = self._list_env_packages()
+            self._collect_packages()
+            self._update_indexes()
+            return {'added': [pk.name for pk in self.packages], 'removed': [], 'upgraded': []}
+
+        fingerprint = Utils.fingerprint_env(self._probe_env().get('path', []), self.fingerprint)
+        changes = {'added': [], 'removed': [], 'upgraded': []}
+        if fingerprint == self.fingerprint:
+            return changes
+        self.fingerprint = fingerprint
+        dists = {name.lower(): (name, version) for name, version in Utils.fingerprint_dists(fingerprint)}
+
+        packages = []
+        for pk in self.packages:
+            dist = dists.pop(pk._pkname, None)
+            if dist is None:
+                changes['removed'].append(pk.name)
+                continue
+            if dist[1] != pk.version:
+                pk.version = dist[1]
+                changes['upgraded'].append(pk.name)
+            packages.append(pk)
+        if dists:
+            added = []
+            self._collect_packages(list(dists.values()), added)
+            packages += added
+            changes['added'] = [pk.name for pk in added]
+        self.packages = packages
+        self._pknames = [(pk.name, pk.version) for pk in packages]
+        self._update_indexes()
+        if DEBUG: print(f'<< REREAD DISTRO {str(self)}: {", ".join(f"{len(v)} {k}" for k, v in changes.items())}')
+        return changes
+
+    def _update_indexes(self):
+        for index in list(self._fleet_indexes):
+            index.update(self)
+
+    def dependency_graph(self, refresh=False):
+        if self._depgraph is None or refresh:
+            self._require_local('read the dependencies of')
+            if DEBUG: print(f'>> READING DEPENDENCIES FOR DISTRO {str(self)} ...')
+            env = self._probe_env()
+            dists = Utils.scan_distributions(env.get('path', []), requires=True) if FAST_LIST else None
+            if not dists:
+                dists = Utils.list_distributions(self.pyexe)
+            self._depgraph = depgraph.DependencyGraph(dists, env.get('markers', None))
+            if DEBUG: print(f'<< READ DEPENDENCIES FOR DISTRO {str(self)}')
+        return self._depgraph
+
+    def install(self, on_install=None, chunk_size=1):
+        self._require_local('install into')
         if not getattr(self, 'packages', None): return
-        return str(self) + NL + super().install(pyexe=self.pyexe, upgrade=True, on_install=on_install)
+        return str(self) + NL + super().install(pyexe=self.pyexe, upgrade=True, on_install=on_install, chunk_size=chunk_size)
 
-    def uninstall(self, packages=None, on_uninstall=None):
+    def uninstall(self, packages=None, on_uninstall=None, chunk_size=1):
+        self._require_local('uninstall from')
         if not getattr(self, 'packages', None): return
-        return str(self) + NL + super().uninstall(packages=packages, pyexe=self.pyexe, on_uninstall=on_uninstall)
+        return str(self) + NL + (super().uninstall(packages=packages, pyexe=self.pyexe, on_uninstall=on_uninstall, chunk_size=chunk_size) or '')
 
     def check(self):
+        self._require_local('check')
         return str(self) + NL + Utils.pip(['check'], None, self.pyexe, self.on_error)
 
     def asdataframe(self):
         return super().asdataframe().rename(columns={'version': self.alias})
 
+    @staticmethod
+    def probe(pyexe):
+        try:
+            with instrument.phase('enumerate', label=f'probe {pyexe}'):
+                return Utils.probe_env(pyexe)
+        except Exception as err:
+            if DEBUG: print(f'FAILED TO PROBE DISTRO {pyexe}: {str(err)}')
+            return {}
+
+    @staticmethod
+    def list_packages(pyexe, env=None, fast_list=None):
+        # (fingerprint, [(name, version)]) of the packages installed in pyexe; env is the probe() result
+        # needed for the fast scan; the fingerprint is None if the packages were listed by pip
+        fast_list = FAST_LIST if fast_list is None else fast_list
+        fingerprint, out = None, None
+        with instrument.phase('enumerate', label=f'list {pyexe}'):
+            if fast_list:
+                fingerprint = Utils.fingerprint_env((env or {}).get('path', []))
+                out = Utils.fingerprint_dists(fingerprint)
+            if not out:
+                fingerprint = None
+                # fall back to pip if the fast scan is disabled or found nothing
+                out = [tuple(s.strip().split('==')) for s in Utils.execute([pyexe, '-m', 'pip', 'list', '--format', 'freeze']).split(NL) if s and '==' in s]
+        return fingerprint, out
+
+    def _probe_env(self):
+        if self.env is None:
+            self.env = Distro.probe(self.pyexe)
+        return self.env
+
     def _list_env_packages(self):
         if DEBUG: print(f'>> LISTING INSTALLED PACKAGES FOR DISTRO {str(self)} ...')
-        out = [tuple(s.strip().split('==')) for s in Utils.execute([self.pyexe, '-m', 'pip', 'list', '--format', 'freeze']).split(NL) if s and '==' in s]
+        self.fingerprint, out = Distro.list_packages(self.pyexe, self._probe_env() if FAST_LIST else None)
         if DEBUG: print(f'<< LISTED INSTALLED PACKAGES FOR DISTRO {str(self)}')
         return out
 
     def _get_env_version(self):
+        version = self._probe_env().get('version', None)
+        if version: return version
         try:
             return Utils.execute([self.pyexe, '-V']).split(' ')[-1].strip()
         except:
             return None
 
     def __hash__(self):
-        return hash((self.pyexe,))
+        return hash((self.pyexe, self.host))
 
     def __eq__(self, other):
         if isinstance(other, str):
             return self.pyexe.lower() == other.lower()
-        return self.pyexe.lower() == other.pyexe.lower()
+        # distros loaded from snapshots of other hosts differ from local ones with the same path
+        return self.pyexe.lower() == other.pyexe.lower() and self.host == other.host
 
     def __str__(self):
-        return f'{self.alias} @ "{self.pyexe}"'
+        return f'{self.alias} @ "{self.host + ":" if self.host else ""}{self.pyexe}"'
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def enumerate_env(pyexe, fast_list=FAST_LIST, probe=True):
+    # (environment probe, fingerprint, [(name, version)]) of an interpreter, as plain data,
+    # so that it can also run in worker processes (ENUM_EXECUTOR_CLASS = ProcessPoolExecutor);
+    # the probe (None if not requested) is needed by the fast scan and for automatic aliases
+    env = Distro.probe(pyexe) if probe or fast_list else None
+    fingerprint, packages = Distro.list_packages(pyexe, env, fast_list)
+    return env, fingerprint, packages
 
 ## ---------------------------------------------------------------------------------------------- ##
 
 class Distros(Dframe):
 
-    def __init__(self, pyexes=None, dbdir=None, save_on_exit=True, append_to_current=CURRENT, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=print):
+    def __init__(self, pyexes=None, dbdir=None, save_on_exit=True, append_to_current=CURRENT, force_update=False, vcomp_or_level=VERS_LEVEL, on_error=print, db_backend='json', snapshots=None, pypi_url=None, import_from=None, on_distro=None, env_cache=True):
         self.force_update = force_update
         self.vcomp = vcomp_or_level if isinstance(vcomp_or_level, VersionCompare) else VersionCompare(vcomp_or_level)
         self.on_error = on_error
-        self.package_cache = {}
-        self.old_package_cache = {}
+        self.package_cache = None
+        self.fetcher = PyPIClient(pypi_url or PYPI_URL, WORKERS, TIMEOUT, RETRIES, BACKOFF, REQUEST_ARGS, on_error)
         self.distros = []
+        self._pkindex = None
         self._it = None
         self.save_on_exit = save_on_exit
         self.append_to_current = append_to_current
         self.dbdir = dbdir or os.path.dirname(os.path.realpath(__file__))
-        self.dbfile = os.path.join(self.dbdir, 'pypkg.json')
+        self.db_backend = db_backend
+        self.dbfile = os.path.join(self.dbdir, pkcache.BACKENDS[db_backend][1])
+        # interpreter metadata cache (see envcache.py), read and saved with every listing of interpreters
+        self.env_cache = envcache.EnvCache(os.path.join(self.dbdir, envcache.FILENAME)) if env_cache else None
+        # file digest cache of check_files() (see drift.py), loaded on first use
+        self.hash_cache = None
         self.load_db()
+        if import_from:
+            for source in ([import_from] if isinstance(import_from, str) else import_from):
+                self.import_cache(source)
+        if snapshots:
+            self.load_snapshot(snapshots)
 
         if pyexes:
             if Utils.is_iterable(pyexes):
@@ -671,17 +1077,98 @@ class Distros(Dframe):
             else:
                 pyexes_ = {pyexes: None}
             # print(pyexes_)
-            self._list_envs(pyexes_)
-        else:
+            self._list_envs(pyexes_, on_distro)
+        elif not snapshots:
             self.distros = [Distro(package_cache=self.package_cache, append_to_current=self.append_to_current,
-                                   force_update=self.force_update, vcomp_or_level=self.vcomp, on_error=self.on_error)]
+                                   force_update=self.force_update, vcomp_or_level=self.vcomp, on_error=self.on_error, fetcher=self.fetcher)]
+            if on_distro: on_distro(self.distros[0])
 
     def __del__(self):
         if self._has_updated() and self.save_on_exit:
             self.save_db()
+        if self.package_cache is not None:
+            self.package_cache.close()
 
     def _has_updated(self):
-        return self.package_cache != self.old_package_cache
+        return self.package_cache is not None and self.package_cache.has_updated()
+
+    def sync(self, packages, targets=None, upgrade=True, force_version=False, chunk_size=None, max_workers=WORKERS,
+             reread=True, on_install=None, on_progress=None):
+        # install the packages into several distros at once: distros run concurrently (up to max_workers),
+        # while each interpreter gets a single serial queue since pip is not safe to run concurrently in one env
+        if not isinstance(packages, Packages):
+            packages = Packages(packages if isinstance(packages, list) else list(packages), self.package_cache,
+                                self.force_update, self.vcomp, self.on_error, self.fetcher)
+        if not packages.packages: return {}
+        targets = [t if isinstance(t, Distro) else self[t] for t in targets] if targets else self.distros
+        # distros loaded from snapshots of other hosts can't be installed into from here
+        targets = [d for d in targets if d.is_local()]
+        queues = {}
+        for d in targets:
+            queues.setdefault(d.pyexe.lower(), []).append(d)
+        total = len(packages)
+        lock = threading.Lock()
+
+        def worker(distros_):
+            outs = []
+            for d in distros_:
+                done = [0]
+                if on_progress:
+                    with lock: on_progress(d, 0, total)
+
+                def on_install_(pk, res):
+                    with lock:
+                        done[0] += 1
+                        if on_install: on_install(d, pk, res)
+                        if on_progress: on_progress(d, done[0], total)
+
+                outs.append(packages.install(pyexe=d.pyexe, upgrade=upgrade, force_version=force_version,
+                                             on_install=on_install_, chunk_size=chunk_size))
+                if reread:
+                    d.reread()
+            return NL.join(out for out in outs if out)
+
+        results = {}
+        if DEBUG: print(f'>> SYNCING {total} PACKAGES TO {len(queues)} DISTROS ...')
+        with MULTI_EXECUTOR_CLASS(max_workers=max(1, min(max_workers, len(queues)))) as executor:
+            futures = {executor.submit(worker, distros_): distros_[0] for distros_ in queues.values()}
+            for future in concurrent.futures.as_completed(futures):
+                d = futures[future]
+                try:
+                    results[d.alias] = future.result()
+                    if DEBUG: print(f'   << SYNCED DISTRO {str(d)}')
+                except Exception as err:
+                    results[d.alias] = None
+                    if self.on_error:
+                        self.on_error(f'Error syncing env "{d.alias}" ("{d.pyexe}"): {str(err)}')
+        if DEBUG: print(f'<< SYNCED {len(results)} DISTROS')
+        return results
+
+    def save_snapshot(self, filepath):
+        return snapshot.write(filepath, [d.snapshot() for d in self.distros], Distro.snapshot_info(self.distros))
+
+    def load_snapshot(self, filepaths):
+        # adds the distros from one or more snapshots (e.g. taken on different hosts);
+        # clashing aliases get the host name and then a number appended
+        filepaths = [filepaths] if isinstance(filepaths, str) else filepaths
+        loaded = []
+        for filepath in filepaths:
+            data = snapshot.read(filepath)
+            Distro.merge_snapshot_info(data['info'], self.package_cache)
+            for record in data['distros']:
+                aliases = set(d.alias for d in self.distros)
+                alias = record['alias']
+                if alias in aliases and record.get('host', None):
+                    alias = f'{alias}@{record["host"]}'
+                cnt = 0
+                while (f'{alias}_{cnt}' if cnt else alias) in aliases:
+                    cnt += 1
+                record = dict(record, alias=f'{alias}_{cnt}' if cnt else alias)
+                distro = Distro.from_snapshot(record, self.package_cache, self.force_update, self.vcomp, self.on_error, self.fetcher)
+                if DEBUG: print(f'   << LOADED DISTRO {str(distro)} FROM "{filepath}"')
+                self._add_distro(distro)
+                loaded.append(distro)
+        return loaded
 
     def list_distros(self, asdict=True):
         if not self.distros: return None
@@ -703,117 +1190,339 @@ class Distros(Dframe):
 
         return None
 
+    def package_index(self):
+        # fleet-wide inverted index of the PEP 503 normalized names of the packages in the distros (see pkindex.py),
+        # built on first use, then kept up to date as distros are added or reread
+        if self._pkindex is None:
+            with instrument.phase('construct', label=f'package index ({len(self.distros)} distros)'):
+                self._pkindex = pkindex.PackageIndex(self.distros)
+        return self._pkindex
+
+    def query(self, query):
+        # {distro alias: installed version} of the distros matching a requirement string, e.g. 'urllib3<2'
+        return {d.alias: version for d, version in self.package_index().query(query)}
+
+    def _add_distro(self, distro):
+        self.distros.append(distro)
+        if self._pkindex is not None:
+            self._pkindex.add(distro)
+
     def load_db(self, filepath=None):
         if filepath:
             self.dbfile = os.path.abspath(filepath)
             self.dbdir = os.path.dirname(self.dbfile)
         if DEBUG: print(f'LOADING DB FROM "{self.dbfile}" ...')
-        self.package_cache.clear()
-        self.old_package_cache.clear()
-        if os.path.isfile(self.dbfile):
-            self.package_cache = json.load(open(self.dbfile, 'r', encoding='utf-8'))
-            self.old_package_cache = self.package_cache.copy()
-            if DEBUG: print(f'LOADED {len(self.package_cache)} PACKAGE DEFS')
-        elif DEBUG:
-            print('NO DB FILE FOUND! (WILL CREATE NEW ON EXIT)')
+        if self.package_cache is not None:
+            self.package_cache.close()
+        cache_class, _ = pkcache.BACKENDS[self.db_backend]
+        exists = os.path.isfile(self.dbfile)
+        with instrument.phase('cache', label='load db'):
+            self.package_cache = cache_class(self.dbfile).load()
+            if not exists and self.db_backend == 'sqlite':
+                # first run on SQLite: import the old JSON database once, if there is one
+                jsfile = os.path.join(self.dbdir, pkcache.BACKENDS['json'][1])
+                if os.path.isfile(jsfile):
+                    imported = self.package_cache.import_json(jsfile)
+                    if DEBUG: print(f'IMPORTED {imported} PACKAGE DEFS FROM "{jsfile}"')
+        if DEBUG:
+            print(f'LOADED {len(self.package_cache)} PACKAGE DEFS' if exists else 'NO DB FILE FOUND! (WILL CREATE NEW ON EXIT)')
 
     def save_db(self, filepath=None):
         if filepath:
-            if self.dbfile != filepath:
-                self.old_package_cache.clear()
             self.dbfile = os.path.abspath(filepath)
             self.dbdir = os.path.dirname(self.dbfile)
-        if not self._has_updated(): return
+        elif not self._has_updated(): return
         if DEBUG: print(f'SAVING DB TO "{self.dbfile}" ...')
-        if self.package_cache:
-            with open(self.dbfile, 'w', encoding='utf-8') as jsfile:
-                json.dump(self.package_cache, jsfile, ensure_ascii=False, indent=2)
+        with instrument.phase('cache', label='save db'):
+            saved = self.package_cache.save(self.dbfile)
+        if saved:
             if DEBUG: print(f'SAVED {len(self.package_cache)} PACKAGE DEFS')
         elif DEBUG:
             print('NO PACKAGE DEFS, NO DB CREATED!')
 
+    def update_db(self, pknames=None, force_update=True):
+        pknames = [pkname.lower() for pkname in (pknames or self.package_cache.keys())]
+        missing = [pkname for pkname in pknames if Package.needs_update(self.package_cache.get(pkname, None), force_update)]
+        if DEBUG: print(f'>> UPDATING DB ({len(missing)} PACKAGES) ...')
+        validators = {pkname: Package.get_validators(self.package_cache.get(pkname, None)) for pkname in missing}
+        infos = self.fetcher.get_infos(missing, self.on_error, validators=validators) if missing else {}
+        for pkname, (inf, validators_) in infos.items():
+            self.package_cache[pkname] = Package.merge_info(pkname, inf, self.package_cache.get(pkname, None), validators_)
+        if DEBUG: print(f'<< UPDATED DB ({len(infos)} PACKAGES)')
+        return infos
+
+    def import_cache(self, source, pknames=None, overwrite=False):
+        # fills the package cache from a bulk source in one streaming pass: a directory of saved
+        # /pypi/<name>/json documents, a JSONL dump (optionally gzipped) or the URL of a simple index
+        # (PEP 503/691, e.g. a local mirror or devpi) read for pknames (default = cached and installed packages);
+        # existing entries are kept if complete and not older, unless overwrite is set
+        if os.path.isdir(source):
+            entries = pkimport.read_json_dir(source)
+        elif os.path.isfile(source):
+            entries = pkimport.read_jsonl(source)
+        elif source.startswith(('http://', 'https://')):
+            pknames = pknames or sorted(set(self.package_cache.keys()) | set(pk._pkname for d in self.distros for pk in d.packages))
+            entries = pkimport.read_simple_index(self.fetcher, pknames, source, self.on_error)
+        else:
+            raise Exception(f'Unknown package info source "{source}"!')
+        wanted = set(Utils.normalize_name(pkname) for pkname in pknames) if pknames else None
+        if DEBUG: print(f'>> IMPORTING PACKAGE DEFS FROM "{source}" ...')
+        count = 0
+        for name, info, fetched in entries:
+            if wanted is not None and Utils.normalize_name(name) not in wanted: continue
+            pkname = name.lower()
+            cached = self.package_cache.get(pkname, None)
+            if not overwrite and not Package.needs_update(cached) and cached.get('fetched', 0) >= fetched: continue
+            self.package_cache[pkname] = Package.merge_info(pkname, info, cached, {'fetched': fetched})
+            count += 1
+        if DEBUG: print(f'<< IMPORTED {count} PACKAGE DEFS')
+        return count
+
+    def iter_latest(self, pknames=None, index_url=None, max_age=None):
+        # refreshes only the 'latest' field of the package info, from simple index pages fetched concurrently
+        # (see PyPIClient.iter_latest); yields (package name, latest version or '' if the request failed) as the
+        # replies arrive. pknames defaults to the installed packages; max_age (in hours) skips the packages
+        # whose latest version was checked or fetched more recently than that
+        holders = self._holders()
+        pknames = [pkname.lower() for pkname in pknames] if pknames else list(holders)
+        return self._refresh_latest(self._stale_latest(pknames, max_age), index_url, holders)
+
+    def iter_outdated(self, refresh=True, index_url=None, max_age=None):
+        # yields (distro, package) for the installed packages older than their latest version, each package as soon
+        # as its latest version is known: the ones not refreshed (refresh=False or max_age) first, then the others
+        # as their replies arrive
+        holders = self._holders()
+        stale = self._stale_latest(list(holders), max_age) if refresh else []
+        refreshed = set(stale)
+        for pkname, pks in holders.items():
+            if pkname in refreshed: continue
+            yield from ((d, pk) for d, pk in pks if pk.is_outdated(self.vcomp))
+        for pkname, _ in self._refresh_latest(stale, index_url, holders):
+            yield from ((d, pk) for d, pk in holders[pkname] if pk.is_outdated(self.vcomp))
+
+    def outdated(self, refresh=True, index_url=None, max_age=None):
+        # the outdated packages of all the distros in one table: name, latest version and the outdated version
+        # in each distro ('' = missing or up to date), computed on the version matrix
+        if refresh:
+            for _ in self.iter_latest(index_url=index_url, max_age=max_age): pass
+        if not self.distros: return pd.DataFrame()
+        vm = self.version_matrix()
+        with instrument.phase('dataframe', label='outdated'):
+            return vm.outdated_versions()
+
+    def _holders(self):
+        # package name -> [(distro, package)] over all the distros
+        holders = {}
+        for d in self.distros:
+            for pk in d.packages:
+                holders.setdefault(pk._pkname, []).append((d, pk))
+        return holders
+
+    def _stale_latest(self, pknames, max_age=None):
+        if not max_age: return pknames
+        now = time.time()
+        def checked(pkinf):
+            return max(pkinf.get('checked', 0), pkinf.get('fetched', 0)) if pkinf else 0
+        return [pkname for pkname in pknames if now - checked(self.package_cache.get(pkname, None)) > max_age * 3600]
+
+    def _refresh_latest(self, pknames, index_url=None, holders=None):
+        for pkname, latest, checked in self.fetcher.iter_latest(pknames, index_url, self.on_error):
+            if latest:
+                cached = self.package_cache.get(pkname, None)
+                pkinf = dict(cached or {'name': pkname}, latest=latest, checked=checked)
+                self.package_cache[pkname] = pkinf
+                # the installed packages share the new record, as they shared the old one
+                for _, pk in (holders or {}).get(pkname, ()):
+                    pk.info = pkinf
+            yield pkname, latest
+
+    def version_matrix(self):
+        # packages x distros matrix of versions, with package info collected once per package name
+        with instrument.phase('dataframe', label=f'version matrix ({len(self.distros)} distros)'):
+            versions = {}
+            meta = {}
+            for d in self.distros:
+                col = {}
+                for pk in d.packages:
+                    col[pk._pkname] = pk.version
+                    if pk._pkname not in meta:
+                        meta[pk._pkname] = pk.asdict(False)
+                versions[d.alias] = col
+            versions = pd.DataFrame(versions, columns=[d.alias for d in self.distros])
+            meta = pd.DataFrame.from_dict(meta, orient='index', columns=Package.prop_names)
+            return vmatrix.VersionMatrix(versions, self.vcomp, meta['latest'], meta)
+
+    def iterrows(self, differs_only=False):
+        # the rows of asdataframe() as dicts (package info, then the version in each distro, '' = missing),
+        # generated one by one in name order without building a dataframe; differs_only skips the packages
+        # installed in the same version (as compared by vcomp) in all the distros
+        index = {}
+        for d in self.distros:
+            for pk in d.packages:
+                index.setdefault(pk._pkname, {})[d.alias] = pk
+        aliases = [d.alias for d in self.distros]
+        for pkname in sorted(index, key=lambda k: str(next(iter(index[k].values())).name).lower()):
+            pks = index[pkname]
+            if differs_only and len(pks) == len(aliases) and len(set(self.vcomp.get_key(pk) for pk in pks.values())) == 1:
+                continue
+            row = next(iter(pks.values())).asdict(False)
+            del row['version']
+            row.update((alias, pks[alias].version if alias in pks else '') for alias in aliases)
+            yield row
+
+    def check_files(self):
+        # content check of the installed files against the RECORD of each distribution, in all the local distros
+        # (distros loaded from snapshots of other hosts are skipped); the files of the whole fleet are hashed in one pass
+        # on HASH_EXECUTOR_CLASS, with the digests cached by path, size and mtime in the database directory;
+        # returns {distro alias: {package name: {'version', 'status', 'identical', 'modified', 'missing', 'content'}}}
+        # with the file counts and the status of each package ('identical', 'modified' or 'missing', see drift.py)
+        if self.hash_cache is None:
+            self.hash_cache = pkcache.JsonCache(os.path.join(self.dbdir, drift.FILENAME)).load()
+        records = {}
+        files = {}
+        with instrument.phase('hash', label='read records'):
+            for d in self.distros:
+                if not d.is_local(): continue
+                fingerprint = d.fingerprint or Utils.fingerprint_env(d._probe_env().get('path', []))
+                dists = drift.locate_dists(fingerprint)
+                records[d.alias] = {}
+                for pk in d.packages:
+                    infodir = dists.get(pk._pkname, None)
+                    pkfiles = drift.record_files(infodir) if infodir else None
+                    if not pkfiles: continue
+                    records[d.alias][pk._pkname] = (pk.version, pkfiles)
+                    files.update((filepath, algo) for filepath, (_, algo, _) in pkfiles.items())
+        if DEBUG: print(f'>> CHECKING {len(files)} FILES IN {len(records)} DISTROS ...')
+        digests = drift.hash_files(files, self.hash_cache, HASH_EXECUTOR_CLASS or concurrent.futures.ProcessPoolExecutor, WORKERS)
+        try:
+            self.hash_cache.save()
+        except OSError as err:
+            if self.on_error:
+                self.on_error(f'Error saving the file digest cache "{self.hash_cache.filepath}": {str(err)}')
+        if DEBUG: print(f'<< CHECKED {len(files)} FILES')
+        return {alias: {pkname: dict(drift.check_dist(pkfiles, digests), version=version) for pkname, (version, pkfiles) in checks.items()}
+                for alias, checks in records.items()}
+
+    @staticmethod
+    def files_status(checks):
+        # {package name: 'identical' / 'modified' / 'missing'} over all the distros, from check_files() results:
+        # 'modified' if any installed copy differs from its RECORD or if intact copies of the same version differ
+        # in content (e.g. different builds or patched and re-recorded files), else 'missing' if any copy lacks files
+        by_package = {}
+        for pkchecks in checks.values():
+            for pkname, check in pkchecks.items():
+                by_package.setdefault(pkname, []).append(check)
+        statuses = {}
+        for pkname, pkchecks in by_package.items():
+            contents = {}
+            for check in pkchecks:
+                if check['status'] == 'identical':
+                    contents.setdefault(check['version'], set()).add(check['content'])
+            if any(check['status'] == 'modified' for check in pkchecks) or any(len(c) > 1 for c in contents.values()):
+                statuses[pkname] = 'modified'
+            elif any(check['status'] == 'missing' for check in pkchecks):
+                statuses[pkname] = 'missing'
+            else:
+                statuses[pkname] = 'identical'
+        return statuses
+
     # overloaded from DFrame
-    def asdataframe(self):
-        l = len(self.distros)
-        if not l: return pd.DataFrame()
-        df = self.distros[0].asdataframe().set_index(Package.prop_names)
-        if l == 1: 
-            return df.reset_index().fillna('').sort_values('name', key=lambda col: col.str.lower()).reset_index(drop=True)
-        for d in self.distros[1:]:
-            df = df.join(d.asdataframe().set_index(Package.prop_names), how='outer')
-        return df.reset_index().fillna('').sort_values('name', key=lambda col: col.str.lower()).reset_index(drop=True)
+    def asdataframe(self, check_files=False):
+        # check_files adds a 'files' column after the package info, see check_files() and files_status()
+        if not self.distros: return pd.DataFrame()
+        vm = self.version_matrix()
+        if check_files:
+            statuses = Distros.files_status(self.check_files())
+            vm.meta['files'] = [statuses.get(pkname, '') for pkname in vm.meta.index]
+        with instrument.phase('dataframe', label='comparison table'):
+            return vm.asdataframe()
 
     # overloaded from DFrame
     def to_xl(self, filepath='pk.xlsx', df=None):
         df = df if not df is None else self.asdataframe()
-        ROWS = len(df) + 1
-        COLS = len(df.columns) + 1
-        try:
-            if DEBUG: print(f'OUTPUTTING TO EXCEL ("{filepath}") ...')
-            df.to_excel(filepath, index_label='packages')
-            wb = load_workbook(filename=filepath)
-            ws = wb.active
-
-            # align first column left
-            for col in ws.iter_cols(max_col=1, min_row=2, max_row=ROWS):
-                for cell in col:
-                    cell.alignment = styles.Alignment(horizontal='left')
-
-            # format as table
-            tab = worksheet.table.Table(displayName='Table1', ref=f'a1:{Utils.num2az(COLS)}{ROWS}')
-            tab.tableStyleInfo = worksheet.table.TableStyleInfo(name='TableStyleMedium8', showFirstColumn=False,
-                                                                showLastColumn=False, showRowStripes=False, showColumnStripes=False)
-            if 'Table1' in ws.tables:
-                del ws.tables['Table1']
-            ws.add_table(tab)
-
-            # adjust col widths
-            COLW = {'a': 27, 'b': 18, 'c': 35, 'd': 77, 'e': 44, 'f': 16}
-            for i in range(7, COLS + 1):
-                COLW[Utils.num2az(i)] = 16
-            for c in COLW:
-                ws.column_dimensions[c].width = COLW[c]
-
-            # highlight missing and latest versions
-            for row in ws.iter_rows(min_row=2, max_row=ROWS, min_col=7, max_col=COLS):
-                for cell in row:
-                    if not cell.value:
-                        cell.style = 'Accent2'
-                cells = list(row)
-                lv = self.vcomp.latest_version([c.value or '' for c in cells])
-                if not lv is None:
-                    cells[lv].style = 'Accent1'
-
-            # save workbook
-            wb.save(filename=filepath)
-            if DEBUG: print(f'SAVED TO EXCEL ("{filepath}")')
-
-        except Exception as err:
-            Utils.trace_exc()
-            # print(err)
+        with instrument.phase('export', label='xlsx'):
+            try:
+                if DEBUG: print(f'OUTPUTTING TO EXCEL ("{filepath}") ...')
+                # highlight missing and latest versions (computed from the dataframe, not from cells)
+                cols = [df.columns.get_loc(d.alias) for d in self.distros if d.alias in df.columns]
+                vm = vmatrix.VersionMatrix(df.iloc[:, cols], self.vcomp)
+                cell_styles = [{} for _ in range(len(df))]
+                for mask, style in ((vm.missing, 'Accent2'), (vm.latest_mask, 'Accent1')):
+                    for i, j in zip(*mask.to_numpy().nonzero()):
+                        cell_styles[i][cols[j]] = style
+                self._write_xl(filepath, df, cell_styles)
+                if DEBUG: print(f'SAVED TO EXCEL ("{filepath}")')
+
+            except Exception as err:
+                Utils.trace_exc()
+                # print(err)
 
     def _list_envs(self, pyexes, on_distro=None):
-        def worker(pyexe, alias):
-            cnt = sum(1 for d in self.distros if d.alias == alias)
-            distro = Distro(pyexe, alias if not cnt else f'{alias}_{cnt}', self.package_cache, self.append_to_current, self.force_update, self.vcomp, self.on_error)
-            self.distros.append(distro)
-            return distro
-
+        # three steps, each within the WORKERS budget and without nested pools:
+        # 1) all interpreters are enumerated concurrently (ENUM_EXECUTOR_CLASS, see enumerate_env),
+        #    except the ones found unchanged in the interpreter metadata cache,
+        # 2) PyPI info missing from the cache is fetched once for the union of their packages,
+        # 3) the distros are built from the cache one by one (this part is CPU-bound)
         if DEBUG: print(f'>> CREATING DIRTROS ({len(pyexes)}) ...')
-        with MULTI_EXECUTOR_CLASS(max_workers=WORKERS) as executor:
-            futures = {executor.submit(worker, *pyexe): pyexe for pyexe in pyexes}
-            for future in concurrent.futures.as_completed(futures):
-                pyexe, alias = futures[future]
-                try:
-                    distro = future.result()
-                    if distro:
-                        if DEBUG: print(f'   << CREATED DISTRO {str(distro)}')
-                        if on_distro: on_distro(distro)
-
-                except Exception as err:
-                    if self.on_error:
-                        self.on_error(f'Error retrieving env "{alias}" ("{pyexe}"): {str(err)}')
-        self.distros = list(set(self.distros))
+        listings = {}
+        pending = pyexes
+        if self.env_cache is not None:
+            with instrument.phase('enumerate', label='env cache lookup'):
+                self.env_cache.load()
+                for pyexe, alias in pyexes:
+                    listing = self.env_cache.get(Distro.get_pyexe(pyexe), FAST_LIST)
+                    if listing is not None:
+                        listings[(pyexe, alias)] = listing
+            pending = [(pyexe, alias) for pyexe, alias in pyexes if (pyexe, alias) not in listings]
+            instrument.count('env_cache_hits', len(listings))
+            instrument.count('env_cache_misses', len(pending))
+            if DEBUG: print(f'   << {len(listings)} DISTROS UNCHANGED SINCE THE LAST RUN')
+
+        if pending:
+            # the probe is needed for automatic aliases and for the fast scan, and to cache the listing
+            with ENUM_EXECUTOR_CLASS(max_workers=max(1, min(WORKERS, len(pending)))) as executor:
+                futures = {executor.submit(enumerate_env, Distro.get_pyexe(pyexe), FAST_LIST, not alias or self.env_cache is not None): (pyexe, alias)
+                           for pyexe, alias in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    pyexe, alias = futures[future]
+                    try:
+                        listings[(pyexe, alias)] = future.result()
+                    except Exception as err:
+                        if self.on_error:
+                            self.on_error(f'Error retrieving env "{alias}" ("{pyexe}"): {str(err)}')
+                        continue
+                    if self.env_cache is not None:
+                        self.env_cache.put(Distro.get_pyexe(pyexe), listings[(pyexe, alias)], FAST_LIST)
+            if self.env_cache is not None:
+                with instrument.phase('enumerate', label='env cache save'):
+                    try:
+                        self.env_cache.save()
+                    except OSError as err:
+                        if self.on_error:
+                            self.on_error(f'Error saving the interpreter cache "{self.env_cache.filepath}": {str(err)}')
+
+        pknames = list(dict.fromkeys(name.lower() for listing in listings.values() for name, _ in listing[2]))
+        if DEBUG: print(f'   << LISTED {len(pknames)} UNIQUE PACKAGES IN {len(listings)} DISTROS')
+        infos = Packages([], self.package_cache, self.force_update, self.vcomp, self.on_error, self.fetcher).fetch_missing(pknames)
+
+        for pyexe, alias in pyexes:
+            if (pyexe, alias) not in listings: continue
+            try:
+                distro = Distro(pyexe, alias, self.package_cache, self.append_to_current, self.force_update, self.vcomp, self.on_error, self.fetcher,
+                                listings[(pyexe, alias)], infos)
+            except Exception as err:
+                if self.on_error:
+                    self.on_error(f'Error retrieving env "{alias}" ("{pyexe}"): {str(err)}')
+                continue
+            if distro in self.distros: continue
+            cnt = 0
+            while any(d.alias == (f'{distro.alias}_{cnt}' if cnt else distro.alias) for d in self.distros):
+                cnt += 1
+            if cnt:
+                distro.alias = f'{distro.alias}_{cnt}'
+            self._add_distro(distro)
+            if DEBUG: print(f'   << CREATED DISTRO {str(distro)}')
+            if on_distro: on_distro(distro)
         if DEBUG: print(f'<< CREATED DIRTROS ({len(self.distros)})')
 
     def __getitem__(self, key):
@@ -833,4 +1542,9 @@ class Distros(Dframe):
         return self._it
 
     def __next__(self):
-        return next(self._it)
\ No newline at end of file
+        return next(self._it)
+
+## ---------------------------------------------------------------------------------------------- ##
+if __name__ == '__main__':
+    import cli
+    sys.exit(cli.main())
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+import re, json, time
+import concurrent.futures
+import instrument
+
+## ---------------------------------------------------------------------------------------------- ##
+
+NL = '\n'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+SIMPLE_ACCEPT = 'application/vnd.pypi.simple.v1+json, text/html;q=0.1'
+SDIST_EXTS = ('.tar.gz', '.tar.bz2', '.tar.xz', '.tgz', '.zip')
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def versions_from_filenames(filenames):
+    # release versions named in wheel and sdist file names (as listed by a simple index)
+    versions = {}
+    for filename in filenames:
+        if filename.endswith('.whl'):
+            parts = filename[:-4].split('-')
+            if len(parts) >= 5: versions[parts[1]] = True
+            continue
+        ext = next((ext for ext in SDIST_EXTS if filename.endswith(ext)), None)
+        if ext and '-' in filename:
+            versions[filename[:-len(ext)].rsplit('-', 1)[1]] = True
+    return list(versions)
+
+def latest_release(versions):
+    # the newest final release (or the newest pre-release if there are no others), as PyPI reports it
+    from packaging.version import Version, InvalidVersion
+    parsed = []
+    for version in versions:
+        try:
+            parsed.append((Version(version), version))
+        except InvalidVersion:
+            continue
+    if not parsed: return ''
+    releases = [p for p in parsed if not p[0].is_prerelease] or parsed
+    return max(releases)[1]
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class PyPIClient:
+
+    def __init__(self, url='https://pypi.org', workers=10, timeout=5, retries=3, backoff=0.5, request_args=None, on_error=None):
+        self.url = url.rstrip('/')
+        self.workers = workers
+        self.timeout = timeout
+        self.request_args = request_args or {}
+        self.on_error = on_error
+        self.retries = retries
+        self.backoff = backoff
+        # a simple index URL (ending in /simple or /+simple, e.g. a local mirror or devpi) is used instead of the JSON API
+        self.simple = self.url.rsplit('/', 1)[-1] in ('simple', '+simple')
+        self._session = None
+
+    @property
+    def session(self):
+        # requests is imported and the session created on the first request
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            session = requests.Session()
+            session.headers.update({'Accept': 'application/json'})
+            # one keep-alive pool shared by all workers; retries back off exponentially and honor Retry-After
+            retry = Retry(total=self.retries, backoff_factor=self.backoff, status_forcelist=RETRY_STATUSES,
+                          allowed_methods=frozenset(['GET']), respect_retry_after_header=True, raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=retry)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    @staticmethod
+    def _count_response(res):
+        instrument.count('http_requests')
+        instrument.count('http_bytes', len(res.content))
+        retries = getattr(res.raw, 'retries', None)
+        if retries is not None and retries.history:
+            instrument.count('http_retries', len(retries.history))
+
+    def get_info(self, pkname, etag=None, modified=None):
+        # returns (info, validators); info is None if the server answered 304 Not Modified
+        if self.simple:
+            return self.get_simple(pkname)
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        res = self.session.get(f'{self.url}/pypi/{pkname}/json', headers=headers, timeout=self.timeout, **self.request_args)
+        PyPIClient._count_response(res)
+        if res.status_code == 304:
+            instrument.count('http_not_modified')
+            return None, {'etag': res.headers.get('ETag', etag) or '', 'modified': res.headers.get('Last-Modified', modified) or '', 'fetched': time.time()}
+        if res.status_code != 200:
+            raise Exception(f'HTTP Error {res.status_code}!{NL}{res.text}')
+        validators = {'etag': res.headers.get('ETag', ''), 'modified': res.headers.get('Last-Modified', ''), 'fetched': time.time()}
+        return json.loads(res.content)['info'], validators
+
+    def get_simple(self, pkname, index_url=None):
+        # (info, validators) like get_info(), from a PEP 691 (JSON) or PEP 503 (HTML) simple index page;
+        # the index has only the versions, so info holds the latest release and the page URL as the homepage
+        index_url = index_url or (self.url if self.simple else self.url + '/simple')
+        url = f'{index_url.rstrip("/")}/{pkname}/'
+        res = self.session.get(url, headers={'Accept': SIMPLE_ACCEPT}, timeout=self.timeout, **self.request_args)
+        PyPIClient._count_response(res)
+        if res.status_code != 200:
+            raise Exception(f'HTTP Error {res.status_code}!{NL}{res.text}')
+        # no 'name' in info: the index only has the normalized one ('zope-interface'), which mustn't replace a display name
+        versions = None
+        if 'json' in res.headers.get('Content-Type', ''):
+            data = json.loads(res.content)
+            versions = data.get('versions', None)
+            filenames = [f['filename'] for f in data.get('files', []) if not f.get('yanked', False)]
+        else:
+            filenames = [fn for attrs, fn in re.findall(r'<a([^>]*)>([^<]+)</a>', res.text) if 'data-yanked' not in attrs]
+        if versions is None:
+            versions = versions_from_filenames(filenames)
+        info = {'version': latest_release(versions), 'package_url': url}
+        return info, {'etag': res.headers.get('ETag', ''), 'modified': res.headers.get('Last-Modified', ''), 'fetched': time.time()}
+
+    def _iter_fetch(self, pknames, fetch, failed, on_error=None):
+        # yields (package name, result) as the concurrent requests complete
+        on_error = on_error or self.on_error
+        pknames = list(dict.fromkeys(pknames))
+        if not pknames: return
+        _ = self.session   # create the shared session before the workers start
+
+        with instrument.phase('fetch', label=f'PyPI ({len(pknames)} packages)', packages=len(pknames)), \
+             concurrent.futures.ThreadPoolExecutor(max_workers=min(self.workers, len(pknames))) as executor:
+            futures = {executor.submit(fetch, pkname): pkname for pkname in pknames}
+            for future in concurrent.futures.as_completed(futures):
+                pkname = futures[future]
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # failed packages get an empty record so that callers don't retry them one by one
+                    result = failed
+                    if on_error:
+                        on_error(f'{pkname}: {str(err)}')
+                    else:
+                        raise
+                yield pkname, result
+
+    def _fetch_all(self, pknames, fetch, failed, on_error=None, on_info=None):
+        results = {}
+        for pkname, result in self._iter_fetch(pknames, fetch, failed, on_error):
+            results[pkname] = result
+            if on_info:
+                on_info(pkname, result)
+        return results
+
+    def get_infos(self, pknames, on_error=None, on_info=None, validators=None):
+        validators = validators or {}
+        return self._fetch_all(pknames, lambda pkname: self.get_info(pkname, *validators.get(pkname, (None, None))), ({}, None),
+                               on_error, (lambda pkname, res: on_info(pkname, *res)) if on_info else None)
+
+    def get_simples(self, pknames, index_url=None, on_error=None, on_info=None):
+        return self._fetch_all(pknames, lambda pkname: self.get_simple(pkname, index_url), ({}, None),
+                               on_error, (lambda pkname, res: on_info(pkname, *res)) if on_info else None)
+
+    def get_latest(self, pkname, index_url=None):
+        # (latest version, fetch timestamp) from the simple index page of the package: a lighter request
+        # than the JSON API document, which carries the full description and metadata
+        info, validators = self.get_simple(pkname, index_url)
+        return info['version'], validators['fetched']
+
+    def iter_latest(self, pknames, index_url=None, on_error=None):
+        # yields (package name, latest version, fetch timestamp) as the concurrent requests complete;
+        # failed packages yield an empty version
+        for pkname, (latest, fetched) in self._iter_fetch(pknames, lambda pkname: self.get_latest(pkname, index_url), ('', None), on_error):
+            yield pkname, latest, fetched
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import os, json, gzip, time, platform
+
+## ---------------------------------------------------------------------------------------------- ##
+
+FORMAT = 'pydistro-snapshot'
+VERSION = 1
+
+# a snapshot is gzipped JSON:
+#   {'format': FORMAT, 'version': VERSION, 'created': timestamp, 'distros': [distro record], 'info': {package name: info}}
+# each distro record keeps its packages as two columns (names and versions):
+#   {'pyexe', 'alias', 'host', 'env', 'fingerprint', 'packages': [[names], [versions]]}
+# package info records are stored once per package name, however many distros have the package
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def local_host():
+    return platform.node()
+
+def write(filepath, distros, info):
+    data = {'format': FORMAT, 'version': VERSION, 'created': time.time(), 'distros': distros, 'info': info}
+    filepath = os.path.abspath(filepath)
+    tmpfile = filepath + '.tmp'
+    with gzip.open(tmpfile, 'wt', encoding='utf-8', compresslevel=6) as snfile:
+        json.dump(data, snfile, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmpfile, filepath)
+    return filepath
+
+def read(filepath):
+    with gzip.open(filepath, 'rt', encoding='utf-8') as snfile:
+        data = json.load(snfile)
+    if not isinstance(data, dict) or data.get('format', None) != FORMAT:
+        raise Exception(f'"{filepath}" is not a pydistro snapshot!')
+    if data.get('version', 0) > VERSION:
+        raise Exception(f'Snapshot "{filepath}" has version {data["version"]}, only versions up to {VERSION} are supported!')
+    return data
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os, sys, subprocess, threading, types, weakref
+import pytest
+import instrument, pydistro, cli, pkcache
+from envcache import EnvCache
+from pkindex import PackageIndex
+
+## ---------------------------------------------------------------------------------------------- ##
+
+@pytest.fixture
+def offline(monkeypatch):
+    # every package gets a complete info record without any PyPI request
+    def fetch_missing(self, pknames, force_update=None):
+        return {pkname: ({'name': pkname, 'home_page': f'https://example.com/{pkname}', 'version': '1.0'}, {}) for pkname in pknames}
+    monkeypatch.setattr(pydistro.Packages, 'fetch_missing', fetch_missing)
+
+def make_dist(path, name, version='1.0'):
+    infodir = os.path.join(path, f'{name}-{version}.dist-info')
+    os.makedirs(infodir)
+    with open(os.path.join(infodir, 'METADATA'), 'w', encoding='utf-8') as mdfile:
+        mdfile.write(f'Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n\n')
+
+## ---------------------------------------------------------------------------------------------- ##
+
+def test_env_cache_hits_with_dbdir_on_path(tmp_path, monkeypatch, offline):
+    # the default dbdir is the script directory, which is on sys.path: the files written there by a run
+    # mustn't invalidate the cached listing of the current interpreter
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for run in range(3):
+        with instrument.profile() as prof:
+            pydistro.Distros([None], str(tmp_path), on_error=None)
+        counters = prof.report()['counters']
+        assert counters.get('env_cache_hits', 0) == (1 if run else 0), f'run {run + 1}: {counters}'
+
+def test_env_cache_key_tracks_dists(tmp_path):
+    site, other = tmp_path / 'site', tmp_path / 'other'
+    make_dist(site, 'pkg')
+    other.mkdir()
+    env = {'path': [str(other), str(site)]}
+    key = EnvCache.make_key(sys.executable, env, True)
+    (other / 'pyenvs.json').write_text('{}')
+    assert EnvCache.make_key(sys.executable, env, True) == key
+    # a first distribution in a directory that had none is a change
+    make_dist(other, 'newpkg')
+    assert EnvCache.make_key(sys.executable, env, True) != key
+
+def test_query_lists_equal_distros_from_several_snapshots(tmp_path, offline):
+    ds = pydistro.Distros([None], str(tmp_path), save_on_exit=False, on_error=None, env_cache=False)
+    filepath = str(tmp_path / 'local.pdsnap')
+    ds.save_snapshot(filepath)
+    pkname = ds.distros[0].packages[0].name
+    ds = pydistro.Distros(None, str(tmp_path), save_on_exit=False, on_error=None, snapshots=[filepath, filepath])
+    assert len(ds.distros) == 2
+    assert sorted(ds.query(pkname)) == sorted(d.alias for d in ds.distros)
+
+def test_index_updates_from_threads():
+    # Distros.sync() rereads the distros in worker threads, each of them gaining the same new packages
+    pk = lambda name, version: types.SimpleNamespace(_pkname=name, version=version)
+    distros = [types.SimpleNamespace(packages=[pk('base', '1.0')], _fleet_indexes=weakref.WeakSet()) for _ in range(32)]
+    index = PackageIndex(distros)
+    barrier = threading.Barrier(len(distros))
+    def reread(distro):
+        distro.packages = distro.packages + [pk(f'new{i}', '2.0') for i in range(200)]
+        barrier.wait()
+        index.update(distro)
+    threads = [threading.Thread(target=reread, args=(d,)) for d in distros]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert all(len(index.query(f'new{i}>=2')) == len(distros) for i in range(200))
+
+@pytest.mark.skipif(os.name != 'posix', reason='needs a shell script as the interpreter')
+@pytest.mark.parametrize('chunk_size', [1, 2])
+def test_failed_pip_run_raises_without_error_handler(tmp_path, offline, chunk_size):
+    pyexe = tmp_path / 'python'
+    pyexe.write_text('#!/bin/sh\necho "pip failed"\nexit 1\n')
+    pyexe.chmod(0o755)
+    pks = pydistro.Packages(['pkg0', 'pkg1'], {}, on_error=None)
+    with pytest.raises(subprocess.CalledProcessError):
+        pks.uninstall(pyexe=str(pyexe), chunk_size=chunk_size)
+
+@pytest.mark.parametrize('specs, expected', [
+    (cli.parse_packages(['pkg0', 'pkg1==1.0.0', 'pkg2']), [('pkg0', None), ('pkg1', '1.0.0'), ('pkg2', None)]),
+    (cli.parse_packages(['pkg1==1.0.0', 'pkg0']), [('pkg1', '1.0.0'), ('pkg0', None)]),
+    (['pkg0', ('pkg1', '1.0.0')], [('pkg0', None), ('pkg1', '1.0.0')]),
+    ([('pkg1', '1.0.0'), 'pkg0'], [('pkg1', '1.0.0'), ('pkg0', None)]),
+])
+def test_mixed_package_specs(offline, specs, expected):
+    # package lists mixing names and pinned versions, as 'sync' gets them from the command line, in both orders
+    errors = []
+    pks = pydistro.Packages(specs, {}, on_error=errors.append)
+    assert not errors
+    assert [(pk.name, pk.version) for pk in pks.packages] == expected
+
+def test_incomplete_cache_backend_fails_on_instantiation(tmp_path):
+    class NoLenCache(pkcache.PackageCache):
+        load = save = get = keys = __setitem__ = lambda self, *args: None
+    with pytest.raises(TypeError):
+        NoLenCache(str(tmp_path / 'cache'))
+    for backend, filename in pkcache.BACKENDS.values():
+        backend(str(tmp_path / filename)).load().close()
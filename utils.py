@@ -1,6 +1,53 @@
 # -*- coding: utf-8 -*-
 import subprocess as sp
-import sys, traceback
+import sys, os, re, json, traceback, importlib
+
+# runs in the target interpreter: version, import paths, site-packages, platform tags and PEP 508 marker values (stdlib only)
+ENV_PROBE = """
+import sys, os, json, platform, site, sysconfig
+def fmt(info):
+    v = '%d.%d.%d' % tuple(info[:3])
+    return v if info.releaselevel == 'final' else v + info.releaselevel[0] + str(info.serial)
+markers = {'implementation_name': sys.implementation.name, 'implementation_version': fmt(sys.implementation.version),
+           'os_name': os.name, 'platform_machine': platform.machine(), 'platform_release': platform.release(),
+           'platform_system': platform.system(), 'platform_version': platform.version(),
+           'python_full_version': platform.python_version(), 'platform_python_implementation': platform.python_implementation(),
+           'python_version': '.'.join(platform.python_version_tuple()[:2]), 'sys_platform': sys.platform}
+impl = {'cpython': 'cp', 'pypy': 'pp'}.get(sys.implementation.name, sys.implementation.name)
+tags = {'interpreter': impl + '%d%d' % sys.version_info[:2], 'abi': sysconfig.get_config_var('SOABI') or '', 'platform': sysconfig.get_platform()}
+sites = site.getsitepackages() + ([site.getusersitepackages()] if site.ENABLE_USER_SITE else [])
+print(json.dumps({'version': '%d.%d.%d' % sys.version_info[:3], 'path': sys.path, 'site': sites, 'tags': tags, 'markers': markers}))
+"""
+
+# runs in the target interpreter: all distributions with their requirements (fallback for scan_distributions)
+DIST_PROBE = """
+import json, importlib.metadata as md
+print(json.dumps([(d.metadata['Name'], d.version, d.requires or []) for d in md.distributions() if d.metadata['Name']]))
+"""
+
+# pip output lines that refer to a single package (group 1 = package name or name-version)
+PIP_LINE_PATTERNS = [re.compile(p) for p in (r'^Requirement already satisfied: ([A-Za-z0-9._-]+)',
+                                             r'^Collecting ([A-Za-z0-9._-]+)',
+                                             r'^\s*Attempting uninstall: ([A-Za-z0-9._-]+)',
+                                             r'^\s*Found existing installation: ([A-Za-z0-9._-]+)',
+                                             r'^\s*Successfully uninstalled ([A-Za-z0-9._-]+)-[^-\s]+$',
+                                             r'Skipping ([A-Za-z0-9._-]+) as it is not installed',
+                                             r'satisfies the requirement ([A-Za-z0-9._-]+)',
+                                             r'No matching distribution found for ([A-Za-z0-9._-]+)')]
+
+class LazyModule:
+
+    # module proxy that imports the real module on first attribute access
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return getattr(module, attr)
 
 class Utils:
 
@@ -49,3 +96,171 @@ class Utils:
             on_error({'cmd': cmd, 'returncode': returncode, 'stdout': stdout, 'stderr': stderr})
 
         return Utils.execute(args_, on_error=on_error_ if on_error else None)
+
+    @staticmethod
+    def normalize_name(name):
+        # PEP 503 normalized package name
+        return re.sub(r'[-_.]+', '-', name).lower()
+
+    @staticmethod
+    def split_pip_output(output, pknames):
+        # split the output of one pip run over many packages into {package name: output lines about it}
+        keys = {Utils.normalize_name(pkname): pkname for pkname in pknames}
+        parts = {pkname: [] for pkname in pknames}
+        for line in (output or '').splitlines():
+            found = []
+            if line.startswith('Successfully installed '):
+                found = [(token.rsplit('-', 1)[0], f'Successfully installed {token}') for token in line.split()[2:]]
+            else:
+                for pattern in PIP_LINE_PATTERNS:
+                    m = pattern.search(line)
+                    if m:
+                        found = [(m.group(1), line.strip())]
+                        break
+            for name, text in found:
+                pkname = keys.get(Utils.normalize_name(name), None)
+                if pkname is not None:
+                    parts[pkname].append(text)
+        return {pkname: '\n'.join(lines) for pkname, lines in parts.items()}
+
+    @staticmethod
+    def probe_env(pyexe=None):
+        # a single interpreter launch (no pip import) returns the python version, import paths, site-packages
+        # directories, platform tags and marker values
+        if not pyexe or os.path.abspath(pyexe) == sys.executable:
+            import packaging.markers, site, sysconfig
+            impl = {'cpython': 'cp', 'pypy': 'pp'}.get(sys.implementation.name, sys.implementation.name)
+            tags = {'interpreter': impl + '%d%d' % sys.version_info[:2], 'abi': sysconfig.get_config_var('SOABI') or '',
+                    'platform': sysconfig.get_platform()}
+            sites = site.getsitepackages() + ([site.getusersitepackages()] if site.ENABLE_USER_SITE else [])
+            return {'version': '%d.%d.%d' % sys.version_info[:3], 'path': sys.path[:], 'site': sites, 'tags': tags,
+                    'markers': packaging.markers.default_environment()}
+        return json.loads(Utils.execute([pyexe, '-c', ENV_PROBE], capture_stderr=False))
+
+    @staticmethod
+    def read_metadata(filepath, fields=('Name', 'Version'), multi=()):
+        # read only the header fields we need from a METADATA / PKG-INFO file;
+        # fields listed in 'multi' may repeat and are collected into lists
+        found = {k: [] for k in multi}
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as file_:
+            for line in file_:
+                if not line.rstrip('\r\n'): break
+                if line[0] in ' \t': continue   # folded continuation of a multi-line header
+                key, _, value = line.partition(':')
+                if key in multi:
+                    found[key].append(value.strip())
+                elif key in fields and key not in found:
+                    found[key] = value.strip()
+                    if not multi and len(found) == len(fields): break
+        return found
+
+    @staticmethod
+    def read_egg_requires(infodir):
+        # convert an egg-info requires.txt into Requires-Dist strings
+        reqs = []
+        filepath = os.path.join(infodir, 'requires.txt')
+        if not os.path.isfile(filepath): return reqs
+        marker = ''
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as file_:
+            for line in file_:
+                line = line.strip()
+                if not line or line.startswith('#'): continue
+                if line.startswith('[') and line.endswith(']'):
+                    extra, _, cond = line[1:-1].partition(':')
+                    marker = ' and '.join(m for m in (f'({cond})' if cond else '', f'extra == "{extra}"' if extra else '') if m)
+                    continue
+                reqs.append(f'{line}; {marker}' if marker else line)
+        return reqs
+
+    @staticmethod
+    def read_dist(path, entry, requires=False):
+        # (name, version) or (name, version, [Requires-Dist]) of a *.dist-info / *.egg-info entry, None if not a distribution
+        infodir = os.path.join(path, entry)
+        if entry.endswith('.dist-info'):
+            mdfile = os.path.join(infodir, 'METADATA')
+        elif entry.endswith('.egg-info'):
+            mdfile = os.path.join(infodir, 'PKG-INFO') if os.path.isdir(infodir) else infodir
+        else:
+            return None
+        try:
+            md = Utils.read_metadata(mdfile, multi=('Requires-Dist',) if requires else ())
+        except OSError:
+            return None
+        name, version = md.get('Name', ''), md.get('Version', '')
+        if not name or not version: return None
+        if not requires:
+            return (name, version)
+        reqs = md['Requires-Dist'] if entry.endswith('.dist-info') else \
+               (Utils.read_egg_requires(infodir) if os.path.isdir(infodir) else [])
+        return (name, version, reqs)
+
+    @staticmethod
+    def scan_distributions(paths, requires=False):
+        # list (name, version) of the distributions installed in the given import paths, like 'pip list' does,
+        # or (name, version, [Requires-Dist]) if requires is set; the first distribution of a given name found on the path wins
+        dists = {}
+        for path in paths:
+            if not path or not os.path.isdir(path): continue
+            try:
+                entries = os.listdir(path)
+            except OSError:
+                continue
+            for entry in entries:
+                dist = Utils.read_dist(path, entry, requires)
+                if dist and dist[0].lower() not in dists:
+                    dists[dist[0].lower()] = dist
+        return list(dists.values())
+
+    @staticmethod
+    def fingerprint_env(paths, previous=None):
+        # {path: [dir mtime, {entry: [entry mtime, name, version]}]} for the distributions in the import paths;
+        # unchanged directories and entries are taken from the previous fingerprint without reading any metadata
+        previous = previous or {}
+        fingerprint = {}
+        for path in paths:
+            if not path or path in fingerprint: continue
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            if not os.path.isdir(path): continue
+            old = previous.get(path, None)
+            if old and old[0] == mtime:
+                fingerprint[path] = old
+                continue
+            old_entries = old[1] if old else {}
+            entries = {}
+            try:
+                names = os.listdir(path)
+            except OSError:
+                continue
+            for entry in names:
+                if not entry.endswith(('.dist-info', '.egg-info')): continue
+                try:
+                    emtime = os.stat(os.path.join(path, entry)).st_mtime_ns
+                except OSError:
+                    continue
+                old_entry = old_entries.get(entry, None)
+                if old_entry and old_entry[0] == emtime:
+                    entries[entry] = old_entry
+                    continue
+                dist = Utils.read_dist(path, entry)
+                if dist:
+                    entries[entry] = [emtime, dist[0], dist[1]]
+            fingerprint[path] = [mtime, entries]
+        return fingerprint
+
+    @staticmethod
+    def fingerprint_dists(fingerprint):
+        # (name, version) list from a fingerprint, the first distribution of a given name on the path wins
+        dists = {}
+        for _, entries in fingerprint.values():
+            for _, name, version in entries.values():
+                if name.lower() not in dists:
+                    dists[name.lower()] = (name, version)
+        return list(dists.values())
+
+    @staticmethod
+    def list_distributions(pyexe=None):
+        # one interpreter launch listing (name, version, [Requires-Dist]) via importlib.metadata
+        return [tuple(d) for d in json.loads(Utils.execute([pyexe or sys.executable, '-c', DIST_PROBE], capture_stderr=False))]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+
+## ---------------------------------------------------------------------------------------------- ##
+
+class VersionMatrix:
+
+    def __init__(self, versions, vcomp, latest=None, meta=None):
+        # versions: DataFrame (packages x distros) of version strings ('' or NaN = missing);
+        # latest: optional Series of the latest PyPI versions; meta: optional DataFrame of package info
+        self.vcomp = vcomp
+        self.versions = versions.fillna('').astype(str)
+        self.latest = latest.reindex(self.versions.index).fillna('').astype(str) if latest is not None else None
+        self.meta = meta
+        self._rank()
+
+    def _rank(self):
+        # every distinct version string is parsed once; the matrix then holds integer ranks of the parsed keys
+        values = self.versions.to_numpy()
+        flat = values.ravel()
+        if self.latest is not None:
+            flat = np.concatenate([flat, self.latest.to_numpy()])
+        codes, uniques = pd.factorize(flat)
+        keys = [self.vcomp.get_version(v) for v in uniques]
+        order = {k: i for i, k in enumerate(sorted(set(keys)))}
+        uranks = np.array([order[k] for k in keys], dtype=np.int64)
+        ranks = uranks[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+        self.ranks = ranks[:values.size].reshape(values.shape)
+        self.latest_ranks = ranks[values.size:] if self.latest is not None else None
+
+    def _frame(self, data):
+        return pd.DataFrame(data, index=self.versions.index, columns=self.versions.columns)
+
+    @property
+    def missing(self):
+        return self._frame(self.versions.to_numpy() == '')
+
+    @property
+    def latest_mask(self):
+        # the single newest version in each row (missing counts as version 0); ties have no latest
+        if not self.ranks.size: return self._frame(np.zeros(self.ranks.shape, dtype=bool))
+        is_max = self.ranks == self.ranks.max(axis=1, keepdims=True)
+        return self._frame(is_max & (is_max.sum(axis=1, keepdims=True) == 1))
+
+    @property
+    def outdated(self):
+        # installed versions older than the latest one on PyPI
+        if self.latest_ranks is None or not self.ranks.size:
+            return self._frame(np.zeros(self.ranks.shape, dtype=bool))
+        has_latest = (self.latest.to_numpy() != '')[:, None]
+        return self._frame(~self.missing.to_numpy() & has_latest & (self.ranks < self.latest_ranks[:, None]))
+
+    @property
+    def differs(self):
+        # packages installed in different versions across the distros that have them
+        missing = self.missing.to_numpy()
+        if not missing.size: return pd.Series(False, index=self.versions.index)
+        hi = np.where(missing, -1, self.ranks).max(axis=1)
+        lo = np.where(missing, np.iinfo(np.int64).max, self.ranks).min(axis=1)
+        return pd.Series((hi >= 0) & (hi > lo), index=self.versions.index)
+
+    def outdated_versions(self):
+        # the packages outdated in at least one distro: name, latest version, then the outdated versions
+        # ('' = missing or up to date in that distro)
+        mask = self.outdated
+        rows = mask.any(axis=1)
+        df = self.versions.where(mask, '')[rows]
+        latest = self.latest[rows] if self.latest is not None else pd.Series('', index=df.index)
+        names = self.meta['name'][rows] if self.meta is not None and 'name' in self.meta.columns else pd.Series(df.index, index=df.index)
+        df.insert(0, 'latest', latest)
+        df.insert(0, 'name', names.fillna('').astype(str))
+        df = df.sort_values('name', key=lambda col: col.str.lower())
+        return df.reset_index(drop=True)
+
+    def flags(self):
+        # per-package summary of all the masks
+        return pd.DataFrame({'missing': self.missing.any(axis=1), 'differs': self.differs,
+                             'outdated': self.outdated.any(axis=1)}, index=self.versions.index)
+
+    def asdataframe(self):
+        df = self.versions if self.meta is None else self.meta.join(self.versions, how='right')
+        df = df.fillna('')
+        if 'name' in df.columns:
+            df = df.sort_values('name', key=lambda col: col.str.lower())
+        return df.reset_index(drop=True)